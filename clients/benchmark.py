@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+#
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""
+Benchmarks of discovery, description parsing and SOAP calls
+
+Runs against simulated devices on loopback, see servers/upnpsim.py, and writes
+the results as JSON, to compare them across versions. Times are in milliseconds,
+memory in bytes.
+Needs the SSDP port 1900 on 127.0.0.1 to be free, as discover() always uses it.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import pathlib
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import typing as t
+
+import upnp
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'servers'))
+import upnpsim  # noqa: E402
+
+log = logging.getLogger(__name__)
+
+ST = upnp.SEARCH_TARGET.WAN_CONNECTION
+Stats = t.Dict[str, float]
+
+
+def stats(samples:t.Sequence[float]) -> Stats:
+    """Summary of <samples>, in seconds, as milliseconds"""
+    ordered = sorted(samples)
+    return {k: round(v * 1000, 4) for k, v in (
+        ('min',    ordered[0]),
+        ('median', statistics.median(ordered)),
+        ('mean',   statistics.fmean(ordered)),
+        ('p95',    ordered[max(0, round(len(ordered) * 0.95) - 1)]),
+        ('max',    ordered[-1]),
+    )}
+
+
+def timed(func:t.Callable[[], t.Any], repeat:int) -> t.List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_discover(devices:int, repeat:int, latency:float) -> dict:
+    """Wall time until all <devices> are found and loaded"""
+    found = []
+
+    def search():
+        # A new transport each run, so no run reuses connections of the previous
+        transport = upnp.Transport()
+        found.append(len(list(upnp.discover(
+            ST, dest_addr='127.0.0.1', unicast=True, source_port=0,
+            transport=transport, timeout=2, max_results=devices,
+        ))))
+
+    with upnpsim.Simulator(devices, latency=latency):
+        samples = timed(search, repeat)
+    return {'devices': devices, 'found': min(found), **stats(samples)}
+
+
+def canned_replies(count:int) -> t.List[t.Tuple[bytes, str]]:
+    """<count> search responses and their sender address, as in a busy network
+
+    Each device replies 3 times with the same location, and 1 in 5 replies is
+    from a device with another search target.
+    """
+    data = []
+    for i in range(count):
+        target = i % 5 != 4
+        st = ST.value if target else upnp.SEARCH_TARGET.MEDIA_SERVER.value
+        addr = f'192.168.{i // 3 % 200}.{i // 600 % 250 + 1}'
+        data.append(('\r\n'.join((
+            'HTTP/1.1 200 OK',
+            'CACHE-CONTROL: max-age=1800',
+            'EXT:',
+            f'LOCATION: http://{addr}:5000/{i // 3}.xml',
+            'SERVER: Linux/5.4 UPnP/1.1 bench/1',
+            f'ST: {st}',
+            f'USN: uuid:00000000-0000-0000-0000-{i // 3:012x}::{st}',
+            '', '',
+        )).encode(), addr))
+    return data
+
+
+def bench_replies(count:int, repeat:int) -> dict:
+    """Filtering of search responses by MSearch.reply(), against parsing them all"""
+    data = canned_replies(count)
+    accepted = []
+
+    def reply():
+        search = upnp.ssdp.MSearch(ST)
+        accepted.append(sum(search.reply(*_) is not None for _ in data))
+
+    def parse_all():
+        for reply_data, addr in data:
+            upnp.SSDP(reply_data.decode(), addr)
+
+    # Ignored non-target replies are logged as warnings
+    logger = logging.getLogger('upnp.ssdp')
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    try:
+        results = {'reply': stats(timed(reply, repeat)),
+                   'parse_all': stats(timed(parse_all, repeat))}
+    finally:
+        logger.setLevel(level)
+    return {'replies': count, 'accepted': min(accepted), **results}
+
+
+def device_parser(location:str, transport:upnp.Transport) -> t.Callable[..., upnp.Device]:
+    """Function building a Device from its descriptions, downloaded only once"""
+    root = transport.fetch(location)
+    device = upnp.Device(location, transport=transport,
+                         xmlroot=upnp.XMLElement.fromstring(root), lazy=True)
+    scpds = [(service.service_type, transport.fetch(service.scpdurl))
+             for service in device.services.values()]
+
+    def parse(**kwargs) -> upnp.Device:
+        parsed = upnp.Device(location, transport=transport,
+                             xmlroot=upnp.XMLElement.fromstring(root), lazy=True, **kwargs)
+        for service_type, scpd in scpds:
+            parsed.services[service_type].load(upnp.XMLElement.fromstring(scpd))
+        return parsed
+    return parse
+
+
+def bench_device(location:str, repeat:int) -> dict:
+    """Device construction over HTTP, and from already downloaded descriptions"""
+    transport = upnp.Transport()
+    fetch = timed(lambda: upnp.Device(location, transport=transport), repeat)
+    parse = device_parser(location, transport)
+    return {'fetch_and_parse': stats(fetch), 'parse': stats(timed(parse, repeat))}
+
+
+def rss() -> int:
+    """Resident memory of this process, in bytes. 0 if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def bench_memory(location:str, count:int) -> dict:
+    """Bytes per loaded Device, keeping and dropping XML trees
+
+    Python objects are measured by tracemalloc. XML trees are allocated by
+    libxml2, so are only seen in the growth of the process resident memory.
+    """
+    parse = device_parser(location, upnp.Transport())
+    results: t.Dict[str, t.Any] = {'devices': count}
+    # All devices are kept alive, so no run reuses memory freed by a previous one
+    devices = []
+    for keep_xml in (False, True):
+        gc.collect()
+        before = rss()
+        tracemalloc.start()
+        devices.append([parse(keep_xml=keep_xml) for _ in range(count)])
+        gc.collect()
+        python, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['keep_xml' if keep_xml else 'compact'] = {
+            'python': python // count,
+            'rss': (rss() - before) // count,
+        }
+    return results
+
+
+def bench_xmlelement(location:str, repeat:int) -> dict:
+    """Lookups in a parsed rootDesc, per 1000 calls"""
+    xmlroot = upnp.XMLElement.fromstring(upnp.Transport().fetch(location))
+    lookups = {
+        'findtext': lambda: xmlroot.findtext('device/friendlyName'),
+        'find':     lambda: xmlroot.find('device/deviceList/device'),
+        'findall':  lambda: list(xmlroot.findall('.//device/serviceList/service')),
+    }
+    results = {}
+    for name, func in lookups.items():
+        def thousand(f=func):
+            for _ in range(1000):
+                f()
+        results[name] = stats(timed(thousand, repeat))
+    return results
+
+
+def bench_action(location:str, calls:int, workers:int) -> dict:
+    """Sequential latency of a simple action, and throughput of concurrent ones"""
+    device = upnp.Device(location, transport=upnp.Transport())
+    service = device[ST]
+    for port in range(10):
+        service.AddPortMapping('', 10000 + port, 'TCP', 80, '192.168.0.2', True, 'bench', 0)
+
+    latency = timed(service.GetExternalIPAddress, calls)
+
+    action = service.GetGenericPortMappingEntry
+    start = time.perf_counter()
+    results = list(action.call_many(({'NewPortMappingIndex': i % 10}
+                                     for i in range(calls)), workers=workers))
+    elapsed = time.perf_counter() - start
+    return {
+        'latency': stats(latency),
+        'throughput': {'calls': len(results), 'workers': workers,
+                       'calls_per_second': round(len(results) / elapsed, 1)},
+    }
+
+
+def run(args:argparse.Namespace) -> dict:
+    results: t.Dict[str, t.Any] = {'discover': [
+        bench_discover(n, args.repeat, args.latency) for n in args.devices
+    ]}
+    results['replies'] = bench_replies(args.replies, args.repeat)
+    with upnpsim.Simulator(1, ssdp_port=0, latency=args.latency) as simulator:
+        location = simulator.location(simulator.devices[0])
+        results['device'] = bench_device(location, args.repeat)
+        results['xmlelement'] = bench_xmlelement(location, args.repeat)
+        results['memory'] = bench_memory(location, args.memory)
+        results['action'] = bench_action(location, args.calls, args.workers)
+    return {
+        'version': upnp.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'options': {k: v for k, v in vars(args).items() if k not in ('output', 'loglevel')},
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-v', '--verbose', dest='loglevel', default=logging.WARNING,
+                        const=logging.INFO, action='store_const',
+                        help="Verbose mode, output extra info.")
+    parser.add_argument('-n', '--devices', default=[1, 10, 50], type=int, nargs='+',
+                        help="Simulated devices to discover. [Default: %(default)s]")
+    parser.add_argument('-r', '--repeat', default=20, type=int,
+                        help="Repetitions of each measurement. [Default: %(default)s]")
+    parser.add_argument('-R', '--replies', default=10000, type=int,
+                        help="Search responses to filter. [Default: %(default)s]")
+    parser.add_argument('-c', '--calls', default=500, type=int,
+                        help="SOAP calls for latency and throughput. [Default: %(default)s]")
+    parser.add_argument('-w', '--workers', default=upnp.SOAP_WORKERS, type=int,
+                        help="Concurrent SOAP calls for throughput. [Default: %(default)s]")
+    parser.add_argument('-m', '--memory', default=500, type=int,
+                        help="Devices to build for memory usage. [Default: %(default)s]")
+    parser.add_argument('-l', '--latency', default=0, type=float,
+                        help="Simulated network latency, in seconds. [Default: none]")
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout,
+                        help="JSON results file. [Default: stdout]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.loglevel, format='%(levelname)-5.5s: %(message)s')
+    json.dump(run(args), args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(2)
+    except upnp.UpnpError as err:
+        log.error(err)
+        sys.exit(1)
@@ -8,6 +8,7 @@
 CLI library demo
 """
 
+import itertools
 import logging
 import pathlib
 import sys
@@ -17,14 +18,26 @@ import upnp
 
 # =============================================================================
 def get_external_ip():
-    for gateway in upnp.discover(upnp.SEARCH_TARGET.WAN_CONNECTION):
-        ip = gateway.actions['GetExternalIPAddres']()[0]
+    st = upnp.SEARCH_TARGET.WAN_CONNECTION
+    # Lazy devices only download the SCPD of the service actually used
+    for gateway in upnp.discover(st, lazy=True):
+        ip = gateway[st].GetExternalIPAddress()[0]
         if ip and not ip == '0.0.0.0':
             return ip
     else:
         raise upnp.UpnpError("No gateway or active internet connection found")
 
 
+def list_port_mappings():
+    st = upnp.SEARCH_TARGET.WAN_CONNECTION
+    for gateway in upnp.discover(st, lazy=True):
+        # Indexes are requested a few at a time, until the first invalid one
+        action = gateway[st].GetGenericPortMappingEntry
+        indexes = ({'NewPortMappingIndex': i} for i in itertools.count())
+        for entry in action.call_many(indexes, stop_on={713}):
+            print(entry)
+
+
 # noinspection PyUnusedLocal
 def demo():
     # Just helping static type checkers that can't follow dynamic attributes
@@ -0,0 +1,104 @@
+#    Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+# Inspired by Nikos Fotoulis public domain code and flyte/upnpclient
+
+# Useful actions:
+# GetExternalIPAddress
+# GetDefaultConnectionService
+# GetStatusInfo
+# GetNATRSIPStatus
+# GetTotalBytesReceived / GetTotalBytesSent
+# GetGenericPortMappingEntry 0..x
+# Browse 0 BrowseDirectChildren '*'
+
+# Useful subscriptions
+# SUBSCRIBE /evt/IPConn HTTP/1.1
+# Host: 10.10.10.1:50628
+# Callback: <http://10.10.10.100:4200/ServiceProxy5>
+# NT: upnp:event
+
+"""upnp - Find and use devices via UPnP"""
+
+__all__ = [
+    'Action',
+    'Daemon',
+    'Device',
+    'DescriptionCache',
+    'EventServer',
+    'Listener',
+    'Metrics',
+    'PortMapper',
+    'PortMapping',
+    'PortMappingTable',
+    'Registry',
+    'Service',
+    'SEARCH_TARGET',
+    'SOAPCall',
+    'SOAPError',
+    'StateMirror',
+    'StateVariable',
+    'Subscription',
+    'Transport',
+    'UpnpError',
+    'UpnpValueError',
+    'UpnpAttributeError',
+    'aio',
+    'cli',
+    'discover',
+    'metrics',
+]
+
+__title__ = 'upnptool'
+__version__ = '2022.07'
+
+from .common import (
+    FETCH_WORKERS,
+    HTTP_POOL_HOSTS,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    SSDP_ADDR,
+    SSDP_BUFFSIZE,
+    SSDP_CPUUID,
+    SSDP_MAX_MX,
+    SSDP_PORT,
+    SSDP_SOURCE_PORT,
+    SSDP_TIMEOUT,
+    SSDP_TTL,
+    SSDP_USER_AGENT,
+    EVENT_PORT,
+    EVENT_TIMEOUT,
+    SOAP_MAX_SIZE,
+    SOAP_WORKERS,
+    DIRECTION,
+    NTS,
+    SEARCH_TARGET,
+    UpnpError,
+    UpnpValueError,
+    UpnpAttributeError,
+    SOAPError,
+)
+from .metrics import PHASE, Metrics
+from .transport import DescriptionCache, Transport
+from .xmlelement import XMLElement
+from .datatypes import StateVariable
+from .events import EventServer, StateMirror, Subscription
+from .device import Action, Device, Service, SOAPCall
+from .ssdp import SSDP, discover
+from .registry import EVENT, Listener, Registry
+from .portmap import PortMapper, PortMapping, PortMappingTable
+from .daemon import Daemon
+from .cli import cli
+from . import aio, metrics
@@ -0,0 +1,20 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""Command-line entry point, as in python3 -m upnp"""
+
+import logging
+import sys
+
+from . import __name__ as package
+from .cli import cli
+from .common import UpnpError
+
+log = logging.getLogger(package)
+
+try:
+    sys.exit(cli(sys.argv[1:]))
+except UpnpError as err:
+    log.error(err)
+    sys.exit(1)
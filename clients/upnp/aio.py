@@ -0,0 +1,257 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""asyncio API for discovery, Device construction and actions
+
+SSDP discovery runs on a native datagram endpoint of the running loop.
+HTTP requests still go through the blocking Transport, run in the loop's
+default executor, so connection pools and the description cache are shared
+with the blocking API. One event loop can drive many devices this way, with
+only the executor's bounded number of threads.
+
+Devices are AsyncDevice wrappers, whose actions are awaitable:
+
+    async for device in upnp.aio.discover(upnp.SEARCH_TARGET.WAN_CONNECTION):
+        result = await device.WANIPConnection.GetExternalIPAddress()
+"""
+
+import asyncio
+import logging
+import typing as t
+
+from . import util
+from .common import (
+    FETCH_WORKERS,
+    SEARCH_TARGET,
+    SSDP_ADDR,
+    SSDP_SOURCE_PORT,
+    SSDP_TIMEOUT,
+    SSDP_TTL,
+    UpnpError,
+    UpnpValueError,
+)
+from .device import Action, Device, Service
+from .ssdp import SSDP, MSearch
+from .transport import Transport
+from .xmlelement import XMLElement
+
+log = logging.getLogger(__name__)
+
+
+class _SearchProtocol(asyncio.DatagramProtocol):
+    def __init__(self, queue:asyncio.Queue, interface:str=""):
+        self.queue = queue
+        self.interface = interface
+
+    def datagram_received(self, data:bytes, addr:tuple) -> None:
+        self.queue.put_nowait((data, addr, self.interface))
+
+    def error_received(self, exc:Exception) -> None:
+        log.warning("Error receiving search response: %s", exc)
+
+
+class AsyncAction:
+    """Awaitable Action: await action(*args) runs Action.acall()
+
+    Other attributes are the ones of the wrapped <action>.
+    """
+    __slots__ = ('action',)
+
+    def __init__(self, action:Action):
+        self.action = action
+
+    def __call__(self, *args, **kwargs) -> t.Awaitable['util.NamedTuple']:
+        return self.action.acall(*args, **kwargs)
+
+    def __getattr__(self, key:str):
+        return getattr(self.action, key)
+
+    def __str__(self):
+        return str(self.action)
+
+    def __repr__(self):
+        return repr(self.action)
+
+
+class AsyncService:
+    """Service whose actions, by name or key, are AsyncActions"""
+    __slots__ = ('service',)
+
+    def __init__(self, service:Service):
+        self.service = service
+
+    @property
+    def actions(self) -> t.Dict[str, AsyncAction]:
+        return {k: AsyncAction(v) for k, v in self.service.actions.items()}
+
+    def __getitem__(self, key:str) -> AsyncAction:
+        return AsyncAction(self.service[key])
+
+    def __getattr__(self, key:str):
+        value = getattr(self.service, key)
+        return AsyncAction(value) if isinstance(value, Action) else value
+
+    def __str__(self):
+        return str(self.service)
+
+    def __repr__(self):
+        return repr(self.service)
+
+
+class AsyncDevice:
+    """Device whose services are AsyncServices and actions are AsyncActions
+
+    Returned by device() and discover(). The wrapped Device is in <device>.
+    Lazy devices should be awaited load() before using their actions.
+    """
+    __slots__ = ('device',)
+
+    def __init__(self, device:Device):
+        self.device = device
+
+    @property
+    def services(self) -> t.Dict[str, AsyncService]:
+        return {k: AsyncService(v) for k, v in self.device.services.items()}
+
+    @property
+    def actions(self) -> t.Dict[str, AsyncAction]:
+        return {k: AsyncAction(v) for k, v in self.device.actions.items()}
+
+    async def load(self) -> None:
+        await load(self.device)
+
+    def __getitem__(self, key:str) -> AsyncService:
+        return AsyncService(self.device[key])
+
+    def __getattr__(self, key:str):
+        value = getattr(self.device, key)
+        return AsyncService(value) if isinstance(value, Service) else value
+
+    def __str__(self):
+        return str(self.device)
+
+    def __repr__(self):
+        return repr(self.device)
+
+
+async def fetch(url:str, transport:Transport=None, tag:tuple=None) -> XMLElement:
+    """Coroutine version of XMLElement.fromurl()"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, XMLElement.fromurl, url, transport, tag)
+
+
+async def load(device:Device) -> None:
+    """Coroutine version of Device.load(), downloading all SCPDs concurrently"""
+    services = [_ for _ in device.services.values() if not _.loaded]
+    scpds = await asyncio.gather(*(fetch(_.scpdurl, device.transport, device.cache_tag)
+                                   for _ in services))
+    for service, scpd in zip(services, scpds):
+        service.load(scpd)
+    device.load()
+
+
+async def device(location:str, *, ssdp:SSDP=None, transport:Transport=None,
+                 lazy:bool=False, keep_xml:bool=True) -> AsyncDevice:
+    """Coroutine version of Device()"""
+    transport = transport or Transport.default()
+    xmlroot = await fetch(location, transport, ssdp and ssdp.cache_tag)
+    dev = Device(location, ssdp=ssdp, transport=transport, lazy=True, xmlroot=xmlroot,
+                 keep_xml=keep_xml)
+    if not lazy:
+        await load(dev)
+    return AsyncDevice(dev)
+
+
+async def discover(
+        search_target:t.Union[str, SEARCH_TARGET]=SEARCH_TARGET.ALL, *,
+        dest_addr:str=SSDP_ADDR,
+        timeout:int=SSDP_TIMEOUT,
+        ttl:int=SSDP_TTL,
+        unicast:bool=False,
+        source_port:int=SSDP_SOURCE_PORT,
+        interfaces:t.Iterable[str]=(),
+        workers:int=FETCH_WORKERS,
+        transport:Transport=None,
+        lazy:bool=False,
+        keep_xml:bool=True,
+        deadline:float=0,
+        max_results:int=0,
+        until:t.Callable[[Device], bool]=None,
+) -> t.AsyncIterator[AsyncDevice]:
+    """Asynchronous iterator version of ssdp.discover(), with the same arguments
+
+    Up to <workers> devices have their descriptions downloaded at once.
+    """
+    search = MSearch(search_target, dest_addr=dest_addr, timeout=timeout, ttl=ttl,
+                     unicast=unicast, source_port=source_port, interfaces=interfaces,
+                     deadline=deadline, max_results=max_results, until=until)
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    endpoints: t.List[asyncio.DatagramTransport] = []
+    semaphore = asyncio.Semaphore(util.clamp(workers, 1))
+
+    async def build(ssdp:SSDP) -> AsyncDevice:
+        location = ssdp.headers.get('LOCATION')
+        if not location:
+            raise UpnpValueError(f"Empty SSDP LOCATION: {ssdp}")
+        async with semaphore:
+            return await device(location, ssdp=ssdp, transport=transport, lazy=lazy,
+                                keep_xml=keep_xml)
+
+    pending: t.Dict[asyncio.Future, SSDP] = {}
+    receive: t.Optional[asyncio.Future] = None
+    try:
+        for interface in search.interfaces:
+            endpoint, _ = await loop.create_datagram_endpoint(
+                lambda: _SearchProtocol(queue, interface), sock=search.open(interface))
+            endpoints.append(endpoint)
+            search.send(endpoint, interface)
+        expire = loop.time() + search.timeout
+        while True:
+            if search.expired():
+                log.debug("Discovery deadline reached")
+                return
+            now = loop.time()
+            if now >= expire and not pending:
+                break
+            # Past the idle timeout, just wait for the remaining devices
+            if now < expire:
+                if receive is None:
+                    receive = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({receive, *pending},
+                                             timeout=search.remaining(expire - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+            else:
+                done, _ = await asyncio.wait(pending, timeout=search.remaining(),
+                                             return_when=asyncio.FIRST_COMPLETED)
+
+            for task in [_ for _ in done if _ in pending]:
+                ssdp = pending.pop(task)
+                try:
+                    dev = task.result()
+                except UpnpValueError as e:
+                    log.debug("Error reading device from %s: %s", ssdp, e)
+                    continue
+                except UpnpError as e:
+                    log.warning("Error reading device from %s: %s", ssdp, e)
+                    continue
+                stop = search.found(dev.device)
+                yield dev
+                if stop:
+                    return
+
+            if receive in done:
+                data, (addr, port), interface = receive.result()
+                receive = None
+                expire = loop.time() + search.timeout
+                ssdp = search.reply(data, addr, port, interface)
+                if ssdp is not None:
+                    pending[asyncio.ensure_future(build(ssdp))] = ssdp
+    finally:
+        for task in (receive, *pending):
+            if task is not None:
+                task.cancel()
+        for endpoint in endpoints:
+            endpoint.close()
+        search.finish()
@@ -0,0 +1,384 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""upnp - Find and use devices via UPnP"""
+
+import argparse
+import json
+import logging
+import signal
+import sys
+import threading
+
+from . import daemon, metrics, util
+from .common import SEARCH_TARGET, SSDP_ADDR, SSDP_SOURCE_PORT, UpnpError, UpnpValueError
+from .device import Device
+from .events import EventServer
+from .registry import Listener, Registry
+from .ssdp import discover
+from .transport import DescriptionCache, Transport
+
+log = logging.getLogger(__name__)
+
+# Options changing which devices are found, so a daemon may not have them
+SEARCH_OPTIONS = ('st', 'destination', 'unicast', 'interfaces', 'port',
+                  'timeout', 'deadline', 'max_results')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-q', '--quiet',
+                       dest='loglevel',
+                       const=logging.WARNING,
+                       default=logging.INFO,
+                       action="store_const",
+                       help="Suppress informative messages.")
+
+    group.add_argument('-v', '--verbose',
+                       dest='loglevel',
+                       const=logging.DEBUG,
+                       action="store_const",
+                       help="Verbose mode, output extra info.")
+
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-s', '--st',
+                       dest='st',
+                       default=SEARCH_TARGET.ALL.value,
+                       help="Search target (ST) paramenter for SSDP discovery."
+                            " [Default: %(default)r]")
+    for st in SEARCH_TARGET:
+        # noinspection PyUnresolvedReferences
+        group.add_argument(f"--{st.name.lower().replace('_', '-')}",
+                           dest='st',
+                           const=st.value,
+                           action="store_const",
+                           help=f"Alias for --st %(const)r")
+
+    parser.add_argument('-d', '--destination',
+                        default=SSDP_ADDR,
+                        help="Destination IP address for SSDP discovery."
+                             " [Default: %(default)r (multicast)]")
+
+    parser.add_argument('-u', '--unicast',
+                        default=False,
+                        action='store_true',
+                        help="Force unicast SSDP search when using --destination"
+                             " instead of filtering the multicast replies.")
+
+    parser.add_argument('-p', '--port',
+                        default=SSDP_SOURCE_PORT,
+                        type=int,
+                        help="SSDP source port. 0 for random."
+                             " [Default: %(default)s]")
+
+    parser.add_argument('-i', '--interface',
+                        dest='interfaces',
+                        default=[],
+                        action='append',
+                        metavar='ADDRESS',
+                        help="Local IPv4 address of the network interface to search"
+                             " on, can be used multiple times. 'all' for every"
+                             " interface. [Default: chosen by the OS]")
+
+    parser.add_argument('-t', '--timeout',
+                        default=3,
+                        type=int,
+                        help="SSDP search discovery timeout after no replies."
+                             " [Default: %(default)s]")
+
+    parser.add_argument('-D', '--deadline',
+                        default=0,
+                        type=float,
+                        help="SSDP search total time limit, in seconds."
+                             " [Default: none, wait for the --timeout]")
+
+    parser.add_argument('-n', '--max-results',
+                        default=0,
+                        type=int,
+                        help="Stop the search after finding this many devices."
+                             " [Default: no limit]")
+
+    parser.add_argument('-c', '--cache',
+                        nargs='?',
+                        const=util.cache_dir(),
+                        metavar='DIR',
+                        help="Cache device descriptions on disk, revalidating"
+                             " them on each run. [Default DIR: %(const)r]")
+
+    parser.add_argument('-S', '--save',
+                        metavar='FILE',
+                        help="Save a snapshot of the devices found, to later --load"
+                             " them with no network requests other than SOAP.")
+
+    parser.add_argument('-L', '--load',
+                        metavar='FILE',
+                        help="Instead of searching, use the devices of a snapshot"
+                             " created by --save.")
+
+    parser.add_argument('--serve',
+                        default=False,
+                        action='store_true',
+                        help="Run as a daemon keeping the devices found, until"
+                             " interrupted. Later runs with no search options"
+                             " send their --action or listing to it instead of"
+                             " searching.")
+
+    parser.add_argument('--socket',
+                        metavar='PATH',
+                        help="Control socket of the daemon."
+                             f" [Default: {daemon.socket_path()!r}]")
+
+    parser.add_argument('--no-daemon',
+                        default=False,
+                        action='store_true',
+                        help="Search even if a daemon is running.")
+
+    parser.add_argument('-l', '--listen',
+                        default=False,
+                        action='store_true',
+                        help="Instead of searching, listen to SSDP advertisements"
+                             " and print devices as they come and go.")
+
+    parser.add_argument('-e', '--events',
+                        default=False,
+                        action='store_true',
+                        help="Subscribe to the events of all services of the devices"
+                             " found, and print them until interrupted.")
+
+    parser.add_argument('-T', '--timings',
+                        default=False,
+                        action='store_true',
+                        help="Print how long each phase took, for each device found:"
+                             " rootDesc and SCPD downloads, construction and SOAP.")
+
+    parser.add_argument('-f', '--full',
+                        default=False,
+                        action='store_true',
+                        help="List Devices, Services and Actions."
+                             " [Default: List Devices only]")
+
+    parser.add_argument('-a', '--action',
+                        help="SOAP action to perform.")
+
+    parser.add_argument(nargs='*',
+                        dest='args',
+                        help="Arguments to SOAP Action")
+
+    args = parser.parse_args(argv)
+    args.debug = args.loglevel == logging.DEBUG
+
+    return args
+
+
+def listen(interfaces):
+    def show(event, ssdp):
+        print(f"{event.value.upper()}: {ssdp!r}")
+
+    registry = Registry()
+    registry.subscribe(show)
+    try:
+        Listener(registry, interfaces=interfaces).run()
+    except KeyboardInterrupt:
+        pass
+
+
+def show_event(subscription, variables):
+    print(f"{subscription.service.device} {subscription.service}"
+          f" [{subscription.seq}]: {util.formatdict(variables)}")
+
+
+def watch(server):
+    if not server.running:
+        raise UpnpError("No services to subscribe to")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def show(device, full=False, interface=False):
+    print(repr(device))
+    print(f"{device} [{device.manufacturer}]")
+    if interface:
+        print(f"Found on {device.interface}")
+    if full:
+        for service in device.services.values():
+            print(f"\t{service!r}")
+            for action in service.actions.values():
+                print(f"\t\t{action!r}")
+    print()
+
+
+def serve(args, interfaces, transport):
+    with daemon.Daemon(
+        args.socket,
+        transport=transport,
+        interfaces=interfaces,
+        search_target=args.st,
+        timeout=args.timeout,
+        dest_addr=args.destination,
+        unicast=args.unicast,
+        source_port=args.port,
+        deadline=args.deadline,
+        max_results=args.max_results,
+        keep_xml=False,
+    ):
+        # Stop cleanly, removing the socket, when terminated as well
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+def delegate(args):
+    """Run the action or listing of <args> on a running daemon, if any"""
+    if args.no_daemon or args.events or args.timings or args.load or args.save:
+        return False
+    defaults = parse_args([])
+    options = [_ for _ in SEARCH_OPTIONS if getattr(args, _) != getattr(defaults, _)]
+    if options:
+        log.debug("Not using a daemon, as search options were given: %s",
+                  ', '.join(options))
+        return False
+    try:
+        sock = daemon.connect(args.socket)
+    except OSError as e:
+        log.debug("No daemon on %r: %s", args.socket or daemon.socket_path(), e)
+        return False
+    with sock:
+        if args.action:
+            reply = daemon.request(sock, 'action', name=args.action, args=args.args)
+            log.info("Executed on %s: %s.%s(%s)",
+                     reply['device'], reply['service'], args.action, args.args)
+            print(reply['output'])
+            return True
+        reply = daemon.request(sock, 'devices')
+    for data in reply['devices']:
+        show(Device.from_snapshot(data), args.full)
+    return True
+
+
+def show_timings(events, devices):
+    """Print the per-device breakdown of metrics <events>"""
+    def total(phase, key, values):
+        ms = [seconds * 1000 for p, seconds, labels in events
+              if p == phase and labels.get(key) in values]
+        return f"{sum(ms):9.1f} ms in {len(ms)}"
+
+    print("Timings:")
+    for phase, seconds, labels in events:
+        if phase == metrics.PHASE.SEARCH:
+            print(f"SSDP search: {seconds * 1000:.1f} ms, {labels['devices']} devices")
+    for device in devices:
+        location = {device.location}
+        scpds = {_.scpdurl for _ in device.services.values()}
+        print(device)
+        print("\trootDesc:", total(metrics.PHASE.DESCRIPTION, 'url', location))
+        print("\tSCPDs:   ", total(metrics.PHASE.DESCRIPTION, 'url', scpds))
+        print("\tDevice:  ", total(metrics.PHASE.DEVICE, 'device', location))
+        print("\tServices:", total(metrics.PHASE.SERVICE, 'device', location))
+        print("\tSOAP:    ", total(metrics.PHASE.SOAP, 'device', location))
+
+
+def save(path, devices):
+    """Write the snapshots of <devices> to <path>, as compact JSON"""
+    with open(path, 'w') as f:
+        json.dump([_.snapshot() for _ in devices], f, separators=(',', ':'))
+    log.info("Saved %s devices to %r", len(devices), path)
+
+
+def load(path, transport):
+    """Devices rebuilt from the snapshots in <path>, see save()"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return [Device.from_snapshot(_, transport=transport) for _ in data]
+    except (OSError, ValueError, LookupError, TypeError) as e:
+        raise UpnpValueError(f"Invalid snapshot file {path!r}: {e}") from e
+
+
+def search(args, interfaces, transport, devices):
+    """Discover and act on devices as set by <args>, appending them to <devices>"""
+    if args.load:
+        found = load(args.load, transport)
+    else:
+        found = discover(
+            args.st,
+            timeout=args.timeout,
+            dest_addr=args.destination,
+            unicast=args.unicast,
+            source_port=args.port,
+            interfaces=interfaces,
+            deadline=args.deadline,
+            max_results=args.max_results,
+            transport=transport,
+            lazy=not args.full,
+        )
+    for device in found:
+        devices.append(device)
+        if args.action:
+            action = device.actions.get(args.action)
+            if action and action.name.lower() == args.action.lower():
+                log.info("Executing on %s: %s.%s(%s)",
+                         device, action.service, action, args.args)
+                print(action(*args.args))
+                return
+            continue
+
+        if args.events:
+            for service in device.services.values():
+                try:
+                    service.subscribe(show_event)
+                except UpnpError as e:
+                    log.warning("Could not subscribe to %s of %s: %s", service, device, e)
+            continue
+
+        show(device, args.full, len(interfaces) > 1)
+
+    if args.action:
+        raise UpnpError(f"Action {args.action!r} not found in any device")
+    if args.events:
+        watch(EventServer.default())
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.loglevel,
+                        format='%(levelname)-5.5s: %(message)s')
+    log.debug(args)
+
+    transport = None
+    if args.cache:
+        transport = Transport(cache=DescriptionCache(args.cache))
+
+    interfaces = args.interfaces
+    if 'all' in interfaces:
+        interfaces = util.get_network_ips()
+
+    if args.listen:
+        return listen(interfaces)
+    if args.serve:
+        return serve(args, interfaces, transport)
+    if delegate(args):
+        return
+
+    devices = []
+    events = []
+    if args.timings:
+        metrics.subscribe(lambda *event: events.append(event))
+    try:
+        search(args, interfaces, transport, devices)
+    finally:
+        if args.timings:
+            show_timings(events, devices)
+    if args.save:
+        save(args.save, devices)
@@ -0,0 +1,92 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""Constants, enums and exceptions shared by all modules"""
+
+import enum
+import platform
+
+from . import __title__, __version__
+
+# For most of these constants, see ref/UPnP-arch-DeviceArchitecture-v2.0-20200417-1.pdf
+SSDP_MAX_MX:        int     = 5  # Max reply delay, per 2.0 spec. NOT a timeout!
+SSDP_BUFFSIZE:      int     = 8192
+SSDP_ADDR:          str     = '239.255.255.250'
+SSDP_PORT:          int     = 1900
+SSDP_TTL:           int     = 2  # Spec: should default to 2 and should be configurable
+
+SSDP_TIMEOUT:       int     = 3  # Not related to spec, and not a total timeout
+SSDP_SOURCE_PORT:   int     = 4201  # Not in spec. 0 for random or fixed for firewalls
+
+FETCH_WORKERS:      int     = 8  # Concurrent rootDesc, and also SCPD, downloads
+SOAP_WORKERS:       int     = 4  # Concurrent SOAP calls in Action.call_many()
+SOAP_MAX_SIZE:      int     = 16 * 1024 * 1024  # Bytes. Larger SOAP responses are refused
+
+EVENT_PORT:         int     = 4200  # Not in spec. Event server port, 0 for random
+EVENT_TIMEOUT:      int     = 1800  # Requested duration of event subscriptions
+
+HTTP_TIMEOUT:       float   = 10  # Connect and read timeout for each HTTP request
+HTTP_POOL_HOSTS:    int     = 10  # Number of per-host connection pools to keep
+HTTP_POOL_SIZE:     int     = 2 * FETCH_WORKERS  # Max keep-alive connections per host
+
+"""REF: UDA2/1.3.2
+USER-AGENT
+Allowed. Specified by UPnP vendor. String. Field value shall begin with the following “product tokens” (defined
+by HTTP/1.1). The first product token identifes the operating system in the form OS name/OS version, the
+second token represents the UPnP version and shall be UPnP/2.0, and the third token identifes the product
+using the form product name/product version. For example, “USER-AGENT: unix/5.1 UPnP/2.0 MyProduct/1.0”."""
+SSDP_USER_AGENT: str = ' '.join((
+    '/'.join((__title__, __version__)),
+    "UPnP/2.0",
+    '/'.join(map(platform.uname().__getitem__, (0, 2))),  # Linux/5.4.0-120-generic
+))
+
+"""REF: UDA2/1.3.2
+CPUUID.UPNP.ORG
+Allowed.uuid of the control point. When the control point is implemented in a UPnP device it is recommended
+to use the UDN of the co-located UPnP device. When implemented, all specified requirements for uuid usage
+in devices also apply for control points.See section 1.1.4. Note that when Device Protection is implemented
+the CPUUID.UPNP.ORG shall be the same as the uuid used in Device Protection.
+REF: UDA2/1.3.2
+The following UUID generation algorithm is recommended: Time & MAC-based algorithm as specified in
+
+"""
+SSDP_CPUUID: str = "ed5c6d80-ec1a-4623-b711-117b88a88af1"
+
+
+# noinspection PyPep8Naming
+class SEARCH_TARGET(str, enum.Enum):
+    """Commonly-used device and service types for UPnP discovery"""
+    ALL            = 'ssdp:all'
+    ROOT           = 'upnp:rootdevice'
+    GATEWAY        = 'urn:schemas-upnp-org:device:InternetGatewayDevice:1'
+    BASIC          = 'urn:schemas-upnp-org:device:Basic:1'
+    MEDIA_SERVER   = 'urn:schemas-upnp-org:device:MediaServer:1'
+    WAN_CONNECTION = 'urn:schemas-upnp-org:service:WANIPConnection:1'
+
+
+class NTS(str, enum.Enum):
+    """Notification sub types of SSDP NOTIFY advertisements"""
+    ALIVE  = 'ssdp:alive'
+    BYEBYE = 'ssdp:byebye'
+    UPDATE = 'ssdp:update'
+
+
+class DIRECTION(str, enum.Enum):
+    IN  = 'in'
+    OUT = 'out'
+
+
+# Exceptions
+class UpnpError(Exception): pass
+class UpnpValueError(UpnpError, ValueError): pass
+class UpnpAttributeError(UpnpError, AttributeError): pass
+
+
+class SOAPError(UpnpError):
+    """SOAP Fault returned by an action, with its UPnPError code, if any"""
+    def __init__(self, code:int, description:str=""):
+        super().__init__(f"UPnPError {code}: {description}")
+        self.code = code
+        self.description = description
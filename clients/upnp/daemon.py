@@ -0,0 +1,300 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""Resident daemon keeping discovered devices warm, and its control socket client
+
+A Daemon searches once, keeps the devices found along with their transport
+connection pools, and follows SSDP advertisements to add new devices and drop
+the ones gone. Clients talk to it over a UNIX socket, so they skip discovery
+and description downloads altogether:
+
+    with connect() as sock:
+        print(request(sock, 'action', name='GetExternalIPAddress')['output'])
+
+The protocol is one JSON object per line each way. Requests have a 'command'
+and its arguments, replies have the command results or an 'error' message:
+    devices: snapshots of all devices, see Device.snapshot()
+    action:  call action <name> with <args> on the first device that has it
+    refresh: search again, replacing all devices
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import typing as t
+
+from . import util
+from .common import FETCH_WORKERS, SEARCH_TARGET, UpnpError
+from .device import Device
+from .registry import EVENT, Listener, Registry
+from .ssdp import SSDP, discover
+from .transport import Transport
+
+log = logging.getLogger(__name__)
+
+# Seconds a client waits for a reply, as actions may take a while
+DAEMON_TIMEOUT: float = 30
+
+Request = t.Dict[str, t.Any]
+Reply = t.Dict[str, t.Any]
+Boot = t.Tuple[str, str]  # BOOTID and CONFIGID of an advertisement
+
+
+def socket_path() -> str:
+    """Default control socket, in the user runtime dir if available"""
+    base = os.environ.get('XDG_RUNTIME_DIR') or util.cache_dir()
+    return os.path.join(base, 'upnp-daemon.sock')
+
+
+def connect(path:str=None, timeout:float=DAEMON_TIMEOUT) -> socket.socket:
+    """Socket connected to the daemon listening on <path>
+
+    Raises OSError, such as FileNotFoundError or ConnectionRefusedError,
+    if no daemon is running there.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path or socket_path())
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def request(sock:socket.socket, command:str, **arguments) -> Reply:
+    """Send <command> to a connected daemon, returning its reply"""
+    try:
+        sock.sendall(json.dumps({'command': command, **arguments}).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            data = f.readline()
+    except OSError as e:
+        raise UpnpError(f"Error talking to daemon: {e}") from e
+    if not data:
+        raise UpnpError("Daemon closed the connection without replying")
+    reply = json.loads(data)
+    if 'error' in reply:
+        raise UpnpError(reply['error'])
+    return reply
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    daemon: 'Daemon'
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: _UnixServer
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+                if not isinstance(req, dict):
+                    raise ValueError("not a JSON object")
+                reply = self.server.daemon.handle(req)
+            except ValueError as e:
+                reply = {'error': f"Invalid request: {e}"}
+            except Exception as e:
+                log.exception("Error handling request %r: %s", line, e)
+                reply = {'error': f"Daemon error: {e}"}
+            self.wfile.write(json.dumps(reply, separators=(',', ':')).encode() + b'\n')
+            self.wfile.flush()
+
+
+class Daemon:
+    """Keep devices found by discover() warm, serving them on a UNIX socket
+
+    <kwargs> are passed to discover(), along with <transport> and <interfaces>.
+    Unless <listen> is false, SSDP advertisements matching the search target
+    add and remove devices afterwards. Each client connection is handled by
+    its own thread. Can also be used as a context manager.
+    """
+    def __init__(self, path:str=None, *, transport:Transport=None,
+                 interfaces:t.Iterable[str]=(), listen:bool=True, **kwargs):
+        self.path = os.path.abspath(path or socket_path())
+        self.transport = transport or Transport()
+        self.interfaces = list(interfaces)
+        self.search_target = kwargs.pop('search_target', SEARCH_TARGET.ALL)
+        self.kwargs = kwargs
+        self.listen = listen
+        self._lock = threading.Lock()
+        self._devices: t.Dict[str, Device] = {}  # By location
+        self._boots: t.Dict[str, Boot] = {}  # Of each device, by location
+        self._loading: t.Set[str] = set()  # Locations being added
+        self._registry = Registry()
+        self._listener: t.Optional[Listener] = None
+        self._executor: t.Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._server: t.Optional[_UnixServer] = None
+        self._thread: t.Optional[threading.Thread] = None
+
+    @property
+    def devices(self) -> t.List[Device]:
+        with self._lock:
+            return list(self._devices.values())
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    def refresh(self) -> t.List[Device]:
+        """Search again, replacing all devices"""
+        devices = {_.location: _ for _ in discover(
+            self.search_target,
+            interfaces=self.interfaces,
+            transport=self.transport,
+            **self.kwargs,
+        )}
+        with self._lock:
+            self._devices = devices
+            self._boots = {k: self._boot(v.ssdp) for k, v in devices.items() if v.ssdp}
+        log.info("Found %s devices", len(devices))
+        return list(devices.values())
+
+    def handle(self, req:Request) -> Reply:
+        """Reply to a client request"""
+        command = req.get('command')
+        try:
+            if command == 'devices':
+                return {'devices': [_.snapshot() for _ in self.devices]}
+            if command == 'action':
+                return self._action(req['name'], req.get('args', []))
+            if command == 'refresh':
+                return {'devices': len(self.refresh())}
+        except KeyError as e:
+            return {'error': f"Missing argument in {command!r} request: {e}"}
+        except UpnpError as e:
+            return {'error': str(e)}
+        return {'error': f"Invalid command: {command!r}"}
+
+    def _action(self, name:str, args:t.List[str]) -> Reply:
+        for device in self.devices:
+            action = device.actions.get(name)
+            if action is None:
+                continue
+            log.info("Executing on %s: %s.%s(%s)", device, action.service, action, args)
+            return {'device': str(device), 'service': str(action.service),
+                    'output': repr(action(*args))}
+        raise UpnpError(f"Action {name!r} not found in any device")
+
+    def _advertised(self, event:EVENT, ssdp:SSDP) -> None:
+        if self.search_target not in (SEARCH_TARGET.ALL, ssdp.target):
+            return
+        location = ssdp.headers.get('LOCATION')
+        if event in (EVENT.REMOVED, EVENT.EXPIRED):
+            with self._lock:
+                device = self._devices.pop(location, None)
+                self._boots.pop(location, None)
+            if device is not None:
+                log.info("Device gone: %s", device)
+            return
+        # A device sends one advertisement per USN, so each change comes many
+        # times. Load it once, and again only if it rebooted or changed config
+        with self._lock:
+            if location in self._loading:
+                return
+            if location in self._devices and (
+                event == EVENT.ADDED or self._boots.get(location) == self._boot(ssdp)
+            ):
+                return
+            self._loading.add(location)
+        # Not in the listener thread, as it downloads descriptions
+        self._executor.submit(self._add, ssdp)
+
+    def _add(self, ssdp:SSDP) -> None:
+        location = ssdp.headers.get('LOCATION')
+        boot = self._boot(ssdp)
+        try:
+            device = Device.from_ssdp(ssdp, transport=self.transport,
+                                      keep_xml=self.kwargs.get('keep_xml', True))
+        except UpnpError as e:
+            log.warning("Could not add advertised device %s: %s", ssdp, e)
+        else:
+            with self._lock:
+                self._devices[device.location] = device
+                self._boots[device.location] = boot
+            log.info("Device added: %s", device)
+        finally:
+            with self._lock:
+                self._loading.discard(location)
+
+    @staticmethod
+    def _boot(ssdp:SSDP) -> Boot:
+        # Copied, as the registry updates the BOOTID of its entries in place.
+        # Same for all USNs of a root device, embedded devices have other UDNs
+        return (ssdp.headers.get('BOOTID.UPNP.ORG', ''),
+                ssdp.headers.get('CONFIGID.UPNP.ORG', ''))
+
+    def _bind(self) -> _UnixServer:
+        # A stale socket file is left by a daemon that did not stop cleanly
+        if os.path.exists(self.path):
+            try:
+                connect(self.path, timeout=1).close()
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise UpnpError(f"Daemon already running on {self.path}")
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        umask = os.umask(0o177)  # Only the user may connect
+        try:
+            return _UnixServer(self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def start(self) -> 'Daemon':
+        """Search and serve in background threads. Socket errors are raised here"""
+        if self.running:
+            return self
+        server = self._bind()
+        server.daemon = self
+        try:
+            self.refresh()
+        except BaseException:
+            server.server_close()
+            os.unlink(self.path)
+            raise
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            FETCH_WORKERS, thread_name_prefix='DaemonFetch')
+        if self.listen:
+            self._registry.subscribe(self._advertised)
+            try:
+                self._listener = Listener(self._registry,
+                                          interfaces=self.interfaces).start()
+            except OSError as e:
+                log.warning("Not following SSDP advertisements: %s", e)
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever,
+                                        name='Daemon', daemon=True)
+        self._thread.start()
+        log.info("Serving %s devices on %s", len(self._devices), self.path)
+        return self
+
+    def stop(self) -> None:
+        server, self._server = self._server, None
+        if server is None:
+            return
+        server.shutdown()
+        server.server_close()
+        self._thread.join()
+        self._thread = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self.listen:
+            self._registry.unsubscribe(self._advertised)
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
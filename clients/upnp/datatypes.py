@@ -0,0 +1,181 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""State variables and the conversion of their data types to and from Python"""
+
+import logging
+import sys
+import typing as t
+
+from . import util
+from .common import UpnpValueError
+from .xmlelement import XMLElement
+
+log = logging.getLogger(__name__)
+
+# REF: UDA2/2.5: Integer data types and their bounds. 'int' has no fixed size
+INTEGERS: t.Dict[str, t.Tuple[t.Optional[int], t.Optional[int]]] = {
+    'ui1': (0, 2**8 - 1),
+    'ui2': (0, 2**16 - 1),
+    'ui4': (0, 2**32 - 1),
+    'ui8': (0, 2**64 - 1),
+    'i1':  (-2**7,  2**7 - 1),
+    'i2':  (-2**15, 2**15 - 1),
+    'i4':  (-2**31, 2**31 - 1),
+    'i8':  (-2**63, 2**63 - 1),
+    'int': (None, None),
+}
+FLOATS: t.Tuple[str, ...] = ('r4', 'r8', 'number', 'fixed.14.4', 'float')
+
+
+def _to_int(value:t.Any) -> int:
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError("not an integer")
+    return int(value)
+
+
+def _to_bool(value:t.Any) -> bool:
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError("not a boolean")
+
+
+class StateVariable:
+    """Service state variable, from an SCPD serviceStateTable
+
+    Converts values between their XML text and Python: int for integer types,
+    float for the other numbers, bool for boolean, and str for everything else.
+    The conversion functions are chosen once, from dataType, on creation.
+    """
+    __slots__ = ('name', 'data_type', 'default_value', 'send_events', 'allowed_values',
+                 '_parse', '_format', 'minimum', 'maximum', 'step', 'lower', 'upper')
+
+    def __init__(self, node:XMLElement):
+        util.attr_tags(self, node, '', '', tags=(
+            'name',          # Required
+            'dataType',      # Required
+            'defaultValue',  # Recommended
+        ))
+        self.name = sys.intern(self.name)
+        self.data_type = sys.intern(self.data_type)
+        # REF: UDA2/2.5: sendEvents defaults to yes
+        self.send_events: bool = node.e.get('sendEvents', 'yes') == 'yes'
+        self.allowed_values: t.Optional[t.List[str]] = [
+            sys.intern(_.text or "") for _ in node.findall('allowedValueList/allowedValue')
+        ] or None
+
+        self._types()
+        self.minimum = self.maximum = self.step = None
+        if node.find('allowedValueRange') is not None and self._parse is not str:
+            self.minimum, self.maximum, self.step = (
+                self._range(_, node.findtext(f'allowedValueRange/{_}'))
+                for _ in ('minimum', 'maximum', 'step')
+            )
+        self._bounds()
+
+    @classmethod
+    def from_snapshot(cls, data:t.Dict[str, t.Any]) -> 'StateVariable':
+        """Rebuild a state variable from its snapshot(), with no XML"""
+        self = cls.__new__(cls)
+        self.name = sys.intern(data['name'])
+        self.data_type = sys.intern(data['type'])
+        self.default_value = data.get('default', "")
+        self.send_events = data.get('events', True)
+        self.allowed_values = [sys.intern(_) for _ in data.get('allowed', ())] or None
+        self._types()
+        self.minimum, self.maximum, self.step = data.get('range') or (None, None, None)
+        self._bounds()
+        return self
+
+    def snapshot(self) -> t.Dict[str, t.Any]:
+        """JSON-serializable data to rebuild this variable. Defaults are omitted"""
+        data: t.Dict[str, t.Any] = {'name': self.name, 'type': self.data_type}
+        if self.default_value:
+            data['default'] = self.default_value
+        if not self.send_events:
+            data['events'] = False
+        if self.allowed_values is not None:
+            data['allowed'] = self.allowed_values
+        if (self.minimum, self.maximum, self.step) != (None, None, None):
+            data['range'] = [self.minimum, self.maximum, self.step]
+        return data
+
+    def _types(self) -> None:
+        self._parse: t.Callable[[t.Any], t.Any] = str
+        self._format: t.Callable[[t.Any], str] = str
+        if self.data_type in INTEGERS:
+            self._parse = _to_int
+        elif self.data_type in FLOATS:
+            self._parse = float
+        elif self.data_type == 'boolean':
+            self._parse = _to_bool
+            self._format = lambda value: '1' if value else '0'
+
+    def _range(self, tag:str, text:t.Optional[str]) -> t.Any:
+        # Unlike decode(), invalid values are dropped, as they are compared to numbers
+        if not text:
+            return None
+        try:
+            return self._parse(text)
+        except ValueError:
+            log.warning("Ignoring invalid %s %r of %s variable %s",
+                        tag, text, self.data_type, self.name)
+            return None
+
+    def _bounds(self) -> None:
+        # Tightest of the data type bounds and allowedValueRange, checked by encode()
+        bounds = INTEGERS.get(self.data_type, (None, None))
+        self.lower = max((_ for _ in (bounds[0], self.minimum) if _ is not None),
+                         default=None)
+        self.upper = min((_ for _ in (bounds[1], self.maximum) if _ is not None),
+                         default=None)
+
+    @property
+    def is_string(self) -> bool:
+        return self._parse is str
+
+    def decode(self, text:t.Optional[str]) -> t.Any:
+        """Python value of XML <text>. Invalid values are returned as-is
+
+        Values received from devices are not checked against any bounds,
+        as many devices are sloppy, say, with counters overflowing ui4.
+        """
+        if text is None or (not text and not self.is_string):
+            return None
+        try:
+            return self._parse(text)
+        except ValueError:
+            log.warning("Invalid %s value for %s: %r", self.data_type, self.name, text)
+            return text
+
+    def encode(self, value:t.Any) -> str:
+        """XML text of <value>, raising UpnpValueError if invalid or out of bounds"""
+        try:
+            value = self._parse(value)
+        except (TypeError, ValueError) as e:
+            raise UpnpValueError(
+                f"Invalid {self.data_type} value for {self.name}: {value!r}, {e}")
+
+        if ((self.lower is not None and value < self.lower) or
+                (self.upper is not None and value > self.upper)):
+            raise UpnpValueError(f"Out of bounds {self.data_type} value for {self.name}:"
+                                 f" {value!r}, must be within [{self.lower}, {self.upper}]")
+        if (self.step and self.minimum is not None and self._parse is _to_int
+                and (value - self.minimum) % self.step):
+            raise UpnpValueError(f"Invalid step for {self.name}: {value!r}")
+
+        text = self._format(value)
+        if self.allowed_values is not None and text not in self.allowed_values:
+            raise UpnpValueError(f"Invalid value for {self.name}: {text!r},"
+                                 f" must be one of {self.allowed_values}")
+        return text
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.name}: {self.data_type}>'
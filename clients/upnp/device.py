@@ -0,0 +1,633 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""Devices, Services and Actions, and their SOAP calls"""
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import itertools
+import logging
+import sys
+import time
+import typing as t
+import xml.sax.saxutils
+
+from . import metrics, util
+from .common import (
+    EVENT_TIMEOUT,
+    SEARCH_TARGET,
+    SOAP_MAX_SIZE,
+    SOAP_WORKERS,
+    SOAPError,
+    UpnpAttributeError,
+    UpnpValueError,
+)
+from .datatypes import StateVariable
+from .events import Callback, EventServer, StateMirror, Subscription
+from .transport import Transport
+from .xmlelement import XMLElement
+
+if t.TYPE_CHECKING:
+    from .ssdp import SSDP
+
+log = logging.getLogger(__name__)
+
+# Positional or keyword arguments of a single call, see Action.call_many()
+Arguments = t.Union[t.Sequence, t.Mapping[str, t.Any]]
+
+# Format of Device.snapshot(), increased on incompatible changes
+SNAPSHOT_VERSION: int = 1
+
+
+class Device:
+    """UPnP Device"""
+    # Set by attr_tags(), the ones shared by all devices of the same model interned
+    _tag_attrs = ('device_type', 'friendly_name', 'manufacturer', 'manufacturer_url',
+                  'model_description', 'model_name', 'model_number', 'model_url',
+                  'serial_number', 'udn', 'upc')
+    _interned = ('device_type', 'manufacturer', 'model_description',
+                 'model_name', 'model_number')
+    __slots__ = ('_actions', 'location', 'ssdp', 'transport', 'cache_tag', 'keep_xml',
+                 'xmlroot', 'url_base', 'services', *_tag_attrs)
+
+    @classmethod
+    def from_ssdp(cls, ssdp:'SSDP', **kwargs):
+        location = ssdp.headers.get('LOCATION')
+        if not location:
+            raise UpnpValueError(f"Empty SSDP LOCATION: {ssdp}")
+        return cls(location, ssdp=ssdp, **kwargs)
+
+    def __init__(self, location:str, *, ssdp:'SSDP'=None, transport:Transport=None,
+                 lazy:bool=False, xmlroot:XMLElement=None, keep_xml:bool=True):
+        """Read the device description from <location>, unless given as <xmlroot>
+
+        In <lazy> mode only the rootDesc is downloaded, and the SCPD of each
+        Service is fetched on first access to its actions. See load().
+
+        Unless <keep_xml>, the XML trees of the device and its services are
+        dropped once read, leaving their xmlroot as None. Worth it for many
+        long-lived devices, as the trees take most of their memory.
+        """
+        start = time.perf_counter()
+        self._actions:  t.Optional[t.Dict[str, Action]] = None
+        self.location:  str                = location
+        self.ssdp:      t.Optional['SSDP'] = ssdp
+        # Used by all services and actions, re-assign to switch transports
+        self.transport: Transport          = transport or Transport.default()
+        self.cache_tag: t.Optional[tuple]  = ssdp and ssdp.cache_tag
+        self.keep_xml:  bool               = keep_xml
+        self.xmlroot:   t.Optional[XMLElement] = xmlroot or XMLElement.fromurl(
+            self.location, self.transport, self.cache_tag)
+        self.url_base:  str                = (self.xmlroot.findtext('URLBase') or
+                                              util.urljoin(self.location, '.'))
+        util.attr_tags(self, self.xmlroot, 'device', '', tags=(
+            'deviceType',        # Required
+            'friendlyName',      # Required
+            'manufacturer',      # Required
+            'manufacturerURL',   # Allowed
+            'modelDescription',  # Recommended
+            'modelName',         # Required
+            'modelNumber',       # Recommended
+            'modelURL',          # Allowed
+            'serialNumber',      # Recommended
+            'UDN',               # Required
+            'UPC',               # Allowed
+        ))
+        for attr in self._interned:
+            setattr(self, attr, sys.intern(getattr(self, attr)))
+
+        if self.ssdp and self.ssdp.headers.get('LOCATION') != self.location:
+            log.warning("URL and Location mismatch: %s, %s",
+                        self.location, self.ssdp.headers.get('LOCATION'))
+
+        self.services: t.Dict[str, Service] = {}
+        for node in self.xmlroot.findall('.//device/serviceList/service'):
+            service = Service(self, node, lazy=True)
+            if any(service.name in _ for _ in self.services):
+                log.warning("Duplicated service in Device %r: %s",
+                            self.udn, service.name)
+            self.services[service.service_type] = service
+        if not keep_xml:
+            self.xmlroot = None
+
+        if not lazy:
+            self.load()
+        metrics.record(metrics.PHASE.DEVICE, time.perf_counter() - start,
+                       device=self.location)
+
+    @classmethod
+    def from_snapshot(cls, data:t.Dict[str, t.Any], *,
+                      transport:Transport=None) -> 'Device':
+        """Rebuild a device, its services and actions from its snapshot(), with no
+        HTTP requests. As in compact mode, there are no XML trees"""
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise UpnpValueError(f"Unsupported snapshot version: {data.get('version')!r}")
+        self = cls.__new__(cls)
+        self._actions  = None
+        self.location  = data['location']
+        self.ssdp      = None
+        self.transport = transport or Transport.default()
+        self.cache_tag = None
+        self.keep_xml  = False
+        self.xmlroot   = None
+        self.url_base  = data['url_base']
+        for attr in self._tag_attrs:
+            value = data.get(attr, "")
+            setattr(self, attr, sys.intern(value) if attr in self._interned else value)
+        self.services = {}
+        for item in data['services']:
+            service = Service.from_snapshot(self, item)
+            self.services[service.service_type] = service
+        self.load()  # Merges the actions, as all services are already loaded
+        return self
+
+    def snapshot(self) -> t.Dict[str, t.Any]:
+        """JSON-serializable data to rebuild this device, see from_snapshot()
+
+        Services not loaded yet have their SCPD downloaded first.
+        """
+        if self._actions is None:
+            self.load()
+        return {
+            'version':  SNAPSHOT_VERSION,
+            'location': self.location,
+            'url_base': self.url_base,
+            **{_: getattr(self, _) for _ in self._tag_attrs if getattr(self, _)},
+            'services': [_.snapshot() for _ in self.services.values()],
+        }
+
+    def load(self) -> None:
+        """Download all SCPDs not loaded yet at once, merging them in rootDesc order"""
+        services = [_ for _ in self.services.values() if not _.loaded]
+        scpds = XMLElement.fromurls((_.scpdurl for _ in services),
+                                    transport=self.transport, tag=self.cache_tag)
+        for service, scpd in zip(services, scpds):
+            service.load(scpd)
+
+        actions: t.Dict[str, Action] = {}
+        for service in self.services.values():
+            dupes = actions.keys() & service.actions  # 1337!
+            if dupes:
+                log.warning("Duplicated action(s) in Device %r: %s",
+                            self.udn, dupes)
+            actions.update(service.actions)
+        self._actions = actions
+
+    @property
+    def actions(self) -> t.Dict[str, 'Action']:
+        if self._actions is None:
+            self.load()
+        return self._actions
+
+    @property
+    def name(self):
+        return self.friendly_name or self.address
+
+    @property
+    def model(self):
+        desc = self.model_description
+        name = self.model_name
+        if name in desc:
+            name = ""
+        return " ".join(filter(None, (desc, name)))
+
+    @property
+    def fullname(self):
+        name = self.name
+        model = self.model
+        if model and not model == name:
+            name += f" ({model})"
+        return name
+
+    @property
+    def address(self):
+        return (self.ssdp and self.ssdp.addr) or util.hostname(self.location)
+
+    @property
+    def interface(self) -> str:
+        """Local address of the network interface the device was discovered on"""
+        return (self.ssdp and self.ssdp.interface) or ""
+
+    def __getitem__(self, key:str) -> 'Service':
+        if isinstance(key, SEARCH_TARGET):
+            key = key.value
+        try:
+            return self.services[key]
+        except KeyError:
+            return getattr(self, key)
+
+    def __getattr__(self, key:str) -> 'Service':
+        # Services by name, as in device.WANIPConnection
+        if key.startswith('_') or key in self.__slots__:
+            raise UpnpAttributeError(f"{self.__class__.__name__} has no attribute '{key}'")
+        for service in self.services.values():
+            if service.name == key:
+                return service
+        raise UpnpAttributeError(f"Device '{self.udn}' has no service '{key}'")
+
+    def __str__(self):
+        return self.fullname
+
+    def __repr__(self):
+        r = f'{self.udn!r}, {self.location!r}, {self.friendly_name!r}'
+        return '<{0.__class__.__name__}({1})>'.format(self, r)
+
+
+class Service:
+    _tag_attrs = ('service_type', 'service_id', 'control_url', 'event_sub_url', 'scpdurl')
+    __slots__ = ('_actions', '_state_variables', '_mirror', 'device', 'xmlroot',
+                 *_tag_attrs)
+
+    def __init__(self, device:Device, service:XMLElement, scpd:XMLElement=None, *,
+                 lazy:bool=False):
+        self._actions: t.Optional[t.Dict[str, Action]] = None
+        self._state_variables: t.Optional[t.Dict[str, StateVariable]] = None
+        self._mirror: t.Optional[StateMirror] = None
+        self.device:   Device = device
+        self.xmlroot:  t.Optional[XMLElement] = None
+        util.attr_tags(self, service, '', device.url_base, tags=(
+            'serviceType',  # Required
+            'serviceId',    # Required
+            'controlURL',   # Required
+            'eventSubURL',  # Required
+            'SCPDURL',      # Required
+        ))
+        self.service_type = sys.intern(self.service_type)
+        self.service_id = sys.intern(self.service_id)
+        if scpd is not None or not lazy:
+            self.load(scpd)
+
+    @classmethod
+    def from_snapshot(cls, device:Device, data:t.Dict[str, t.Any]) -> 'Service':
+        """Rebuild a service of <device> from its snapshot(), already loaded"""
+        self = cls.__new__(cls)
+        self._mirror = None
+        self.device  = device
+        self.xmlroot = None
+        for attr in self._tag_attrs:
+            setattr(self, attr, data[attr])
+        self.service_type = sys.intern(self.service_type)
+        self.service_id = sys.intern(self.service_id)
+        self._state_variables = {
+            _.name: _ for _ in map(StateVariable.from_snapshot, data['state_variables'])
+        }
+        self._actions = {
+            _.name: _ for _ in (Action.from_snapshot(self, a) for a in data['actions'])
+        }
+        return self
+
+    def snapshot(self) -> t.Dict[str, t.Any]:
+        """JSON-serializable data to rebuild this service, loading it if needed"""
+        return {
+            **{_: getattr(self, _) for _ in self._tag_attrs},
+            'state_variables': [_.snapshot() for _ in self.state_variables.values()],
+            'actions': [_.snapshot() for _ in self.actions.values()],
+        }
+
+    def load(self, scpd:XMLElement=None) -> None:
+        """Build the state variables and actions from <scpd>, downloading it if not given"""
+        with metrics.timer(metrics.PHASE.SERVICE,
+                           device=self.device.location, service=self.name):
+            xmlroot = scpd or XMLElement.fromurl(self.scpdurl, self.device.transport,
+                                                 self.device.cache_tag)
+            self._state_variables = {
+                _.name: _ for _ in map(StateVariable,
+                                       xmlroot.findall('serviceStateTable/stateVariable'))
+            }
+            actions: t.Dict[str, Action] = {}
+            for node in xmlroot.findall('actionList/action'):
+                action = Action(self, node)
+                actions[action.name] = action
+            self._actions = actions
+            self.xmlroot = xmlroot if self.device.keep_xml else None
+
+    @property
+    def loaded(self) -> bool:
+        return self._actions is not None
+
+    @property
+    def actions(self) -> t.Dict[str, 'Action']:
+        if self._actions is None:
+            self.load()
+        return self._actions
+
+    @property
+    def state_variables(self) -> t.Dict[str, StateVariable]:
+        if self._state_variables is None:
+            self.load()
+        return self._state_variables
+
+    @property
+    def name(self) -> str:
+        return self.service_type.split(':')[-2]
+
+    def subscribe(self, callback:Callback, *, timeout:int=EVENT_TIMEOUT,
+                  server:EventServer=None) -> Subscription:
+        """Call <callback> on each event of the service, until unsubscribed
+
+        Events are received by <server>, by default the shared EventServer.default().
+        See Subscription.
+        """
+        return (server or EventServer.default()).subscribe(self, callback, timeout=timeout)
+
+    def mirror(self, *, max_age:float=0, timeout:int=EVENT_TIMEOUT,
+               server:EventServer=None) -> StateMirror:
+        """Local copy of the evented state variables, created on first use
+
+        Later calls return the same StateMirror, unless it was closed.
+        """
+        if self._mirror is None or not self._mirror.subscription.active:
+            self._mirror = StateMirror(self, max_age=max_age, timeout=timeout,
+                                       server=server)
+        return self._mirror
+
+    def batch(self, calls:t.Iterable[t.Tuple[str, Arguments]], *,
+              workers:int=SOAP_WORKERS,
+              stop_on:t.Container[int]=()) -> t.Iterator['util.NamedTuple']:
+        """Call several actions, given as (name, arguments) pairs. See Action.call_many()"""
+        return _call_many(((self[name], args) for name, args in calls),
+                          workers=workers, stop_on=stop_on)
+
+    def __getitem__(self, key:str) -> 'Action':
+        try:
+            return self.actions[key]
+        except KeyError:
+            raise UpnpAttributeError(f"Service '{self.name}' has no action '{key}'")
+
+    def __getattr__(self, key:str) -> 'Action':
+        # Actions by name, as in service.GetExternalIPAddress, loading lazy services
+        if key.startswith('_') or key in self.__slots__:
+            raise UpnpAttributeError(f"{self.__class__.__name__} has no attribute '{key}'")
+        if key in self.actions:
+            return self.actions[key]
+        raise UpnpAttributeError(f"Service '{self.name}' has no action '{key}'")
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        attrs = {
+            'service_type':  'type',
+            'scpdurl':       'SCPD',
+            'control_url':   'CTRL',
+            'event_sub_url': 'EVT',
+        }
+        r = util.formatdict({v: getattr(self, k) for k, v in attrs.items()})
+        return f'<{self.__class__.__name__}({r})>'
+
+
+# noinspection PyUnr esolvedReferences
+class Action:
+    __slots__ = ('service', 'name', 'inputs', 'outputs', 'variables', '_result_type')
+    max_size: int = SOAP_MAX_SIZE  # Of call() responses, in bytes. Set in the class
+
+    def __init__(self, service:Service=None, action:XMLElement=None):
+        self.service = service
+        self.name = sys.intern(action.findtext('name'))
+        self._result_type: t.Optional[t.Type['util.NamedTuple']] = None
+
+        self.inputs  = []
+        self.outputs = []
+        # Arguments data types. Missing if the SCPD has no related state variable
+        self.variables: t.Dict[str, StateVariable] = {}
+        state_variables = service.state_variables if service else {}
+        for arg in action.findall('argumentList/argument'):
+            argname = sys.intern(arg.findtext('name'))
+            variable = state_variables.get(arg.findtext('relatedStateVariable'))
+            if variable is not None:
+                self.variables[argname] = variable
+            if arg.findtext('direction') == 'in':
+                self.inputs.append(argname)
+            else:
+                self.outputs.append(argname)
+
+    @classmethod
+    def from_snapshot(cls, service:Service, data:t.Dict[str, t.Any]) -> 'Action':
+        """Rebuild an action of <service> from its snapshot()"""
+        self = cls.__new__(cls)
+        self.service = service
+        self.name = sys.intern(data['name'])
+        self._result_type = None
+        self.inputs  = []
+        self.outputs = []
+        self.variables = {}
+        for names, arguments in ((self.inputs, data['in']), (self.outputs, data['out'])):
+            for argname, varname in arguments:
+                argname = sys.intern(argname)
+                names.append(argname)
+                variable = service.state_variables.get(varname)
+                if variable is not None:
+                    self.variables[argname] = variable
+        return self
+
+    def snapshot(self) -> t.Dict[str, t.Any]:
+        """JSON-serializable data to rebuild this action, with its arguments
+        as [name, related state variable name] pairs"""
+        def arguments(names:t.List[str]) -> t.List[t.List[t.Optional[str]]]:
+            return [[_, self.variables[_].name if _ in self.variables else None]
+                    for _ in names]
+        return {'name': self.name, 'in': arguments(self.inputs),
+                'out': arguments(self.outputs)}
+
+    def call(self, *args, **kwargs) -> 'util.NamedTuple':
+        if len(args) > len(self.inputs):
+            raise UpnpValueError("{}() takes {} arguments but {} were given".format(
+                self.name, len(self.inputs), len(args)))
+        kw = {_[0]: _[1] for _ in zip(self.inputs, args)}
+        kw.update(kwargs)
+        kw = {k: self.variables[k].encode(v) if k in self.variables else v
+              for k, v in kw.items()}
+        service = self.service.service_type
+        headers, data = _soap_request(self.service.control_url, service, self.name, kw)
+        with metrics.timer(metrics.PHASE.SOAP, device=self.service.device.location,
+                           service=self.service.name, action=self.name):
+            chunks = self.service.device.transport.stream(
+                'POST', self.service.control_url, max_size=self.max_size,
+                headers=headers, data=data)
+            try:
+                out = _soap_decode(chunks, service, self.name, self.outputs)
+            finally:
+                chunks.close()
+        return self.result_type(**{k: self.variables[k].decode(v) if k in self.variables
+                                   else v for k, v in out.items()})
+
+    def __call__(self, *args, **kwargs) -> 'util.NamedTuple':
+        return self.call(*args, **kwargs)
+
+    @property
+    def result_type(self) -> t.Type['util.NamedTuple']:
+        """Type of call() results, built on first use and shared by all calls"""
+        if self._result_type is None:
+            self._result_type = util.NamedTuple(self.name, self.outputs)
+        return self._result_type
+
+    def call_many(self, argsets:t.Iterable[Arguments], *,
+                  workers:int=SOAP_WORKERS,
+                  stop_on:t.Container[int]=()) -> t.Iterator['util.NamedTuple']:
+        """Call the action once per item of <argsets>, yielding results in order
+
+        Each item is either a sequence of positional arguments or a dict of
+        keyword ones. Up to <workers> calls run at once, sharing the device
+        Transport connection pool, and <argsets> is consumed lazily, so it can
+        be endless. A SOAPError with a code in <stop_on> silently ends the
+        iteration, any other error is raised. To list all port mappings:
+
+            action.call_many(({'NewPortMappingIndex': i} for i in itertools.count()),
+                             stop_on={713})  # SpecifiedArrayIndexInvalid
+        """
+        return _call_many(((self, args) for args in argsets),
+                          workers=workers, stop_on=stop_on)
+
+    async def acall(self, *args, **kwargs) -> 'util.NamedTuple':
+        """Coroutine version of call(), for use with asyncio. See aio"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.call, *args, **kwargs))
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return (f"<{self.__class__.__name__} {self.name}({', '.join(self.inputs)})"
+                f" -> [{', '.join(self.outputs)}]>")
+
+
+def _call_many(calls:t.Iterable[t.Tuple[Action, Arguments]], *,
+               workers:int=SOAP_WORKERS,
+               stop_on:t.Container[int]=()) -> t.Iterator['util.NamedTuple']:
+    def submit(action:Action, args:Arguments) -> concurrent.futures.Future:
+        if isinstance(args, t.Mapping):
+            return pool.submit(action.call, **args)
+        return pool.submit(action.call, *args)
+
+    workers = util.clamp(workers, 1)
+    calls = iter(calls)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    pending: t.Deque[concurrent.futures.Future] = collections.deque(
+        submit(*_) for _ in itertools.islice(calls, workers))
+    try:
+        while pending:
+            future = pending.popleft()
+            try:
+                result = future.result()
+            except SOAPError as e:
+                if e.code in stop_on:
+                    log.debug("Stopping batch on %s", e)
+                    return
+                raise
+            # Keep the pool busy while the caller handles this result
+            pending.extend(submit(*_) for _ in itertools.islice(calls, 1))
+            yield result
+    finally:
+        # Calls already running past a stop are finished but their results dropped
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@functools.lru_cache(maxsize=256)
+def _soap_template(service:str, action:str) -> t.Tuple[bytes, bytes, t.Dict[str, str]]:
+    """Envelope head and tail, and HTTP headers, of a SOAP action call
+
+    Built once per service type and action, so calls only fill in the arguments
+    """
+    head = (
+        '<?xml version="1.0"?>\n'
+        '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"'
+        ' s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+        f'<s:Body><u:{action} xmlns:u="{service}">'
+    )
+    tail = f'</u:{action}></s:Body></s:Envelope>'
+    headers = {
+        'SOAPAction': f'"{service}#{action}"',
+        'Content-Type': 'text/xml; charset="utf-8"',
+    }
+    return head.encode(), tail.encode(), headers
+
+
+def _soap_request(url:str, service:str, action:str,
+                  kwargs:t.Dict[str, t.Any]) -> t.Tuple[t.Dict[str, str], bytes]:
+    """HTTP headers and body of a SOAP action call"""
+    head, tail, headers = _soap_template(service, action)
+    data = b''.join((head, "".join(f"<{k}>{xml.sax.saxutils.escape(str(v))}</{k}>"
+                                   for k, v in kwargs.items()).encode(), tail))
+    if log.isEnabledFor(logging.INFO):
+        log.info("Executing SOAP Action: %s.%s(%s) @ %s",
+                 service, action, util.formatdict(kwargs), url)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(headers)
+        log.debug(XMLElement.prettify(data))
+    return headers, data
+
+
+def _soap_decode(chunks:t.Iterable[bytes], service:str, action:str,
+                 outputs:t.Iterable[str]) -> t.Dict[str, t.Optional[str]]:
+    """Output arguments of a SOAP response, read in a single streaming pass
+
+    Only the output elements are kept, and only their text. A SOAP Fault raises
+    SOAPError as soon as it is parsed, without waiting for the rest of the body.
+    """
+    response = f'{{{service}}}{action}Response'
+    out: t.Dict[str, t.Optional[str]] = dict.fromkeys(outputs)  # None if missing
+    fault: t.Dict[str, str] = {}
+    found = False
+    state = ""  # 'response' or 'fault' while inside one of them
+    depth = 0   # Envelope is 1, Body is 2
+    debug = [] if log.isEnabledFor(logging.DEBUG) else None
+    if debug is not None:
+        chunks = (debug.append(_) or _ for _ in chunks)
+
+    for event, e in XMLElement.iterparse(chunks):
+        if event == 'start':
+            depth += 1
+            if depth == 3:
+                if e.tag == response:
+                    state = 'response'
+                elif e.tag.endswith('}Fault'):
+                    state = 'fault'
+            continue
+
+        depth -= 1
+        if depth == 2:
+            if state == 'fault':
+                code = fault.get('errorCode', "")
+                raise SOAPError(int(code) if code.isdigit() else 0,
+                                fault.get('errorDescription') or
+                                fault.get('faultstring', ""))
+            found = found or state == 'response'
+            state = ""
+        elif state:
+            name = e.tag.rpartition('}')[2]
+            if state == 'response' and depth == 3 and name in out:
+                out[name] = e.text or ""
+            elif state == 'fault':
+                fault[name] = e.text or ""
+            e.clear()
+
+    if debug is not None:
+        log.debug(b''.join(debug).decode(errors='replace'))
+    if not found:
+        raise UpnpValueError(f"No {action}Response in SOAP response")
+    return out
+
+
+# noinspection PyPep8Naming
+def SOAPCall(url, service, action, *, transport:Transport=None, **kwargs) -> XMLElement:
+    headers, data = _soap_request(url, service, action, kwargs)
+    with metrics.timer(metrics.PHASE.SOAP, url=url, action=action):
+        content = b''.join((transport or Transport.default()).stream(
+            'POST', url, max_size=SOAP_MAX_SIZE, headers=headers, data=data))
+    xml_root = XMLElement.fromstring(content)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(xml_root.pretty())
+
+    fault = xml_root.find('{*}Body/{*}Fault')
+    if fault is not None:
+        code = fault.findtext('.//{*}errorCode') or ""
+        raise SOAPError(int(code) if code.isdigit() else 0,
+                        fault.findtext('.//{*}errorDescription') or
+                        fault.findtext('faultstring') or "")
+
+    # This is very strict. if things go wrong, replace with:
+    # return xml_root.find(f'.//{{{service}}}*'), or just return xml_root
+    return xml_root.find(f'{{*}}Body/{{{service}}}{action}Response')
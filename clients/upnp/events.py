@@ -0,0 +1,471 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""GENA event subscriptions, and the embedded server receiving their events
+
+    def show(subscription, variables):
+        print(subscription.service, variables)
+
+    subscription = device.WANIPConnection.subscribe(show)
+    ...
+    subscription.unsubscribe()
+"""
+
+import heapq
+import http
+import http.server
+import itertools
+import logging
+import threading
+import time
+import typing as t
+
+from . import util
+from .common import (
+    EVENT_PORT,
+    EVENT_TIMEOUT,
+    HTTP_TIMEOUT,
+    SOAP_MAX_SIZE,
+    UpnpError,
+    UpnpValueError,
+)
+from .xmlelement import XMLElement
+
+if t.TYPE_CHECKING:
+    import requests
+    from .device import Action, Service
+
+log = logging.getLogger(__name__)
+
+# Subscriptions are renewed after this fraction of the timeout granted by the device
+EVENT_RENEW_AT: float = 0.8
+
+# Seconds an event waits for the previous one of its subscription, handled by
+# another thread, so they are delivered in order
+EVENT_ORDER_WAIT: float = 1
+
+Callback = t.Callable[['Subscription', t.Dict[str, t.Any]], None]
+
+
+def parse_timeout(value:str) -> t.Optional[int]:
+    """Seconds from a GENA TIMEOUT header such as 'Second-1800'. None if infinite"""
+    value = value.strip().lower()
+    if value == 'second-infinite':
+        return None
+    if value.startswith('second-') and value[7:].isdigit():
+        return int(value[7:])
+    raise UpnpValueError(f"Invalid TIMEOUT header: {value!r}")
+
+
+def parse_propertyset(data:bytes) -> t.Dict[str, str]:
+    """State variable names and values from the body of an event NOTIFY"""
+    variables = {}
+    for prop in XMLElement.fromstring(data).findall('{*}property'):
+        for e in prop.e:
+            variables[e.tag.rpartition('}')[2]] = e.text or ""
+    return variables
+
+
+class Subscription:
+    """GENA subscription to the evented state variables of a Service
+
+    Created by EventServer.subscribe() or Service.subscribe(). Each event calls
+    <callback> with the Subscription and a dict of the changed variables and
+    their values, converted by their Service.state_variables. The first event
+    after subscribing has all evented variables. Can be used as a context
+    manager, unsubscribing on exit.
+    """
+    def __init__(self, service:'Service', callback:Callback, server:'EventServer',
+                 timeout:int=EVENT_TIMEOUT):
+        self.service:  'Service'         = service
+        self.callback: Callback          = callback
+        self.server:   'EventServer'     = server
+        self.timeout:  int               = timeout  # Requested, not granted
+        self.sid:      str               = ""
+        self.seq:      int               = -1  # Event key of the last event
+        self.expires:  t.Optional[float] = None  # Monotonic, None if infinite
+        self._delivered = threading.Condition()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.sid)
+
+    def _request(self, method:str, **headers) -> 'requests.Response':
+        r = self.service.device.transport.request(method, self.service.event_sub_url,
+                                                  headers=headers)
+        if not r.ok:
+            raise UpnpError(f"{method} {self.service.event_sub_url} failed for"
+                            f" {self.service}: {r.status_code} {r.reason}")
+        return r
+
+    def _granted(self, r:'requests.Response') -> None:
+        timeout = parse_timeout(r.headers.get('TIMEOUT', f'Second-{self.timeout}'))
+        self.expires = None if timeout is None else time.monotonic() + timeout
+
+    def subscribe(self, callback_url:str) -> None:
+        """Send a new SUBSCRIBE request. See EventServer.subscribe()"""
+        r = self._request('SUBSCRIBE', CALLBACK=f'<{callback_url}>', NT='upnp:event',
+                          TIMEOUT=f'Second-{self.timeout}')
+        sid = r.headers.get('SID', '')
+        if not sid:
+            raise UpnpValueError(f"No SID in SUBSCRIBE response from {self.service}")
+        self.sid, self.seq = sid, -1
+        self._granted(r)
+        log.info("Subscribed to events of %s: %s", self.service, self.sid)
+
+    def renew(self) -> None:
+        r = self._request('SUBSCRIBE', SID=self.sid, TIMEOUT=f'Second-{self.timeout}')
+        self._granted(r)
+        log.debug("Renewed subscription to events of %s: %s", self.service, self.sid)
+
+    def unsubscribe(self) -> None:
+        self.server.unsubscribe(self)
+
+    def deliver(self, seq:int, variables:t.Dict[str, str]) -> None:
+        """Convert and hand over the <variables> of an event to the callback
+
+        Events are delivered one at a time, and in SEQ order unless the
+        previous one takes longer than EVENT_ORDER_WAIT to arrive.
+        """
+        state_variables = self.service.state_variables
+        variables = {k: state_variables[k].decode(v) if k in state_variables else v
+                     for k, v in variables.items()}
+        with self._delivered:
+            # Event keys wrap around to 1, and 0 is a (re-)subscription initial event
+            self._delivered.wait_for(lambda: (seq == 0 or self.seq < 0 or
+                                              seq == (self.seq % 0xFFFFFFFF) + 1),
+                                     timeout=EVENT_ORDER_WAIT)
+            self.seq = seq
+            try:
+                self.callback(self, variables)
+            except Exception as e:
+                log.exception("Error in event callback %r: %s", self.callback, e)
+            finally:
+                self._delivered.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unsubscribe()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}({self.service}, sid={self.sid!r})>'
+
+
+class _NotifyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, devices may send several events
+    server: '_HTTPServer'
+
+    def do_NOTIFY(self):
+        if not (self.headers.get('NT') == 'upnp:event' and
+                self.headers.get('NTS') == 'upnp:propchange'):
+            return self.reply(http.HTTPStatus.BAD_REQUEST)
+        # Waits if the SUBSCRIBE that created this SID is still in progress
+        subscription = self.server.events.get(self.headers.get('SID', ''))
+        if subscription is None:
+            return self.reply(http.HTTPStatus.PRECONDITION_FAILED)
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+            seq = int(self.headers.get('SEQ', ''))
+            if length > SOAP_MAX_SIZE:
+                raise UpnpValueError(f"too large: {length} bytes")
+            variables = parse_propertyset(self.rfile.read(length))
+        except ValueError as e:  # Also UpnpValueError
+            log.warning("Invalid event from %s for %s: %s",
+                        self.client_address[0], subscription, e)
+            return self.reply(http.HTTPStatus.BAD_REQUEST)
+        # Reply before calling back, so slow callbacks do not hold the device
+        self.reply(http.HTTPStatus.OK)
+        log.debug("Event %d for %s: %s", seq, subscription, variables)
+        subscription.deliver(seq, variables)
+
+    def reply(self, status:http.HTTPStatus) -> None:
+        if status != http.HTTPStatus.OK:
+            self.close_connection = True  # Body might be unread
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, fmt, *args):
+        log.debug("Event server: %s - %s", self.address_string(), fmt % args)
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    events: 'EventServer'
+
+
+class EventServer:
+    """Embedded HTTP server receiving the events of GENA Subscriptions
+
+    Listens on <address>:<port>, by default on all interfaces, each NOTIFY
+    handled by its own thread. A background thread renews subscriptions
+    before they expire, re-subscribing if the device has dropped them.
+    Can also be used as a context manager.
+    """
+    _default: t.Optional['EventServer'] = None
+
+    @classmethod
+    def default(cls) -> 'EventServer':
+        """Shared server used when none is explicitly given, started on first use"""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __init__(self, *, address:str="", port:int=EVENT_PORT):
+        self.address = address
+        self.port = port
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._registered = threading.Condition(self._lock)
+        self._pending = 0  # SUBSCRIBE requests in progress
+        self._subscriptions: t.Dict[str, Subscription] = {}
+        self._heap: t.List[t.Tuple[float, int, Subscription]] = []  # Lazily pruned
+        self._counter = itertools.count()  # Heap tie-breaker
+        self._server: t.Optional[_HTTPServer] = None
+        self._threads: t.List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    def start(self) -> 'EventServer':
+        """Listen and renew in background threads. Socket errors are raised here"""
+        with self._lock:
+            if self.running:
+                return self
+            self._stop.clear()
+            self._server = _HTTPServer((self.address, self.port), _NotifyHandler)
+            self._server.events = self
+            self.port = self._server.server_address[1]
+            self._threads = [
+                threading.Thread(target=self._server.serve_forever,
+                                 name='EventServer', daemon=True),
+                threading.Thread(target=self._renew_loop,
+                                 name='EventRenewal', daemon=True),
+            ]
+        for thread in self._threads:
+            thread.start()
+        log.info("Listening to events on %s:%s", self.address or '*', self.port)
+        return self
+
+    def stop(self) -> None:
+        """Unsubscribe from all events and stop the server"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+        for subscription in subscriptions:
+            self.unsubscribe(subscription)
+        with self._lock:
+            server, self._server = self._server, None
+            self._stop.set()
+            self._wakeup.notify_all()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def callback_url(self, service:'Service') -> str:
+        """URL the device of <service> should send its events to"""
+        address = self.address or util.get_local_ip(util.hostname(service.event_sub_url))
+        return f'http://{address}:{self.port}/upnp/event'
+
+    def subscribe(self, service:'Service', callback:Callback, *,
+                  timeout:int=EVENT_TIMEOUT) -> Subscription:
+        """Subscribe to the events of <service>, starting the server if needed"""
+        self.start()
+        subscription = Subscription(service, callback, self, timeout)
+        self._subscribe(subscription)
+        return subscription
+
+    def _subscribe(self, subscription:Subscription) -> None:
+        # The initial event may arrive before the SUBSCRIBE response, so get()
+        # waits for the requests in progress. Those are not sent under the lock,
+        # which would stall all other events and renewals meanwhile
+        with self._lock:
+            self._pending += 1
+        try:
+            subscription.subscribe(self.callback_url(subscription.service))
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if subscription.sid:
+                    self._register(subscription)
+                self._registered.notify_all()
+
+    def unsubscribe(self, subscription:Subscription) -> None:
+        with self._lock:
+            if self._subscriptions.get(subscription.sid) is not subscription:
+                return
+            del self._subscriptions[subscription.sid]
+        try:
+            subscription._request('UNSUBSCRIBE', SID=subscription.sid)
+            log.info("Unsubscribed from events of %s", subscription.service)
+        except UpnpError as e:
+            # Not really a problem, it will expire anyway
+            log.debug("Error unsubscribing from %s: %s", subscription, e)
+        subscription.sid = ""
+
+    def get(self, sid:str) -> t.Optional[Subscription]:
+        """Subscription of <sid>, waiting for the SUBSCRIBE requests in progress"""
+        with self._lock:
+            self._registered.wait_for(lambda: sid in self._subscriptions or not self._pending,
+                                      timeout=HTTP_TIMEOUT)
+            return self._subscriptions.get(sid)
+
+    def _register(self, subscription:Subscription) -> None:
+        self._subscriptions[subscription.sid] = subscription
+        if subscription.expires is not None:
+            now = time.monotonic()
+            renew = now + (subscription.expires - now) * EVENT_RENEW_AT
+            heapq.heappush(self._heap, (renew, next(self._counter), subscription))
+            self._wakeup.notify()
+
+    def _renew_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._stop.is_set() and (
+                    not self._heap or self._heap[0][0] > time.monotonic()
+                ):
+                    self._wakeup.wait(self._heap[0][0] - time.monotonic()
+                                      if self._heap else None)
+                if self._stop.is_set():
+                    return
+                _, _, subscription = heapq.heappop(self._heap)
+                if self._subscriptions.get(subscription.sid) is not subscription:
+                    continue  # Unsubscribed meanwhile
+            self._renew(subscription)
+
+    def _renew(self, subscription:Subscription) -> None:
+        try:
+            subscription.renew()
+        except UpnpError as e:
+            # Most likely 412 Precondition Failed: device dropped it, say, on reboot
+            log.warning("Error renewing %s, subscribing again: %s", subscription, e)
+            with self._lock:
+                if self._subscriptions.pop(subscription.sid, None) is not subscription:
+                    return
+                subscription.sid = ""
+            try:
+                self._subscribe(subscription)
+            except UpnpError as e:
+                log.error("Lost subscription to events of %s: %s", subscription.service, e)
+            return
+        with self._lock:
+            if self._subscriptions.get(subscription.sid) is subscription:
+                self._register(subscription)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __repr__(self):
+        return (f'<{self.__class__.__name__}({self.address or "*"}:{self.port},'
+                f' {len(self._subscriptions)} subscriptions)>')
+
+
+class StateMirror:
+    """Local copy of the evented state variables of a Service, kept by its events
+
+    Reads are answered from memory while the subscription is active, no SEQ
+    gap was detected since the variable was last received and, if <max_age> is
+    set, it is not older than that many seconds. Otherwise the variable is read
+    again by calling an action of the service that returns it, with no
+    arguments, such as GetExternalIPAddress for ExternalIPAddress. Variables no
+    action returns are always read from memory.
+
+        mirror = device.WANIPConnection.mirror()
+        ip = mirror['ExternalIPAddress']
+    """
+    def __init__(self, service:'Service', *, max_age:float=0,
+                 timeout:int=EVENT_TIMEOUT, server:'EventServer'=None):
+        self.service = service
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._values: t.Dict[str, t.Any] = {}
+        self._updated: t.Dict[str, float] = {}  # Monotonic. Missing if stale
+        self._seq = -1
+
+        # Evented variable name -> (action, output argument) returning it
+        self.getters: t.Dict[str, t.Tuple['Action', str]] = {}
+        for action in service.actions.values():
+            if action.inputs:
+                continue
+            for arg in action.outputs:
+                variable = action.variables.get(arg)
+                if variable is not None and variable.send_events:
+                    self.getters.setdefault(variable.name, (action, arg))
+
+        server = server or EventServer.default()
+        self.subscription = server.subscribe(service, self._update, timeout=timeout)
+
+    def _update(self, subscription:Subscription, variables:t.Dict[str, t.Any]) -> None:
+        seq = subscription.seq
+        now = time.monotonic()
+        with self._lock:
+            if seq == self._seq:
+                log.debug("Ignoring repeated event %d for %s", seq, self.service)
+                return
+            # Event keys wrap around to 1, and 0 is a (re-)subscription initial event
+            if seq and self._seq >= 0 and seq != (self._seq % 0xFFFFFFFF) + 1:
+                log.warning("Events %d to %d of %s were lost, state is now stale",
+                            self._seq + 1, seq - 1, self.service)
+                self._updated.clear()
+            self._seq = seq
+            self._values.update(variables)
+            self._updated.update(dict.fromkeys(variables, now))
+
+    def fresh(self, name:str) -> bool:
+        """If variable <name> can be read from memory"""
+        with self._lock:
+            updated = self._updated.get(name)
+        return (updated is not None and self.subscription.active and
+                (not self.max_age or time.monotonic() - updated <= self.max_age))
+
+    def get(self, name:str) -> t.Any:
+        """Value of evented state variable <name>, from memory if fresh"""
+        if self.fresh(name) or (name not in self.getters and name in self._values):
+            return self._values[name]
+        return self.refresh(name)
+
+    def refresh(self, name:str) -> t.Any:
+        """Read variable <name> from the device, updating the mirror"""
+        variable = self.service.state_variables.get(name)
+        if variable is None or not variable.send_events:
+            raise UpnpValueError(f"{name!r} is not an evented variable of {self.service}")
+        if name not in self.getters:
+            raise UpnpValueError(f"{name!r} of {self.service} was not received yet"
+                                 f" and no action returns it")
+        action, arg = self.getters[name]
+        log.debug("Reading stale %s of %s using %s", name, self.service, action)
+        result = action()
+        now = time.monotonic()
+        with self._lock:
+            # Every evented variable the action returns is now fresh
+            for out in action.outputs:
+                variable = action.variables.get(out)
+                if variable is not None and variable.send_events:
+                    self._values[variable.name] = result[out]
+                    self._updated[variable.name] = now
+        return result[arg]
+
+    def close(self) -> None:
+        self.subscription.unsubscribe()
+
+    def __getitem__(self, name:str) -> t.Any:
+        return self.get(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}({self.service}, {len(self._values)} variables)>'
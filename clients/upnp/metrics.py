@@ -0,0 +1,157 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""Timing hooks of discovery, description downloads and SOAP calls
+
+Each instrumented phase is reported to all subscribed observers, as a PHASE,
+its duration in seconds, and a dict of string labels identifying what was
+timed, such as 'device' (its location), 'url', 'service' or 'action'. Failed
+phases also have an 'error' label, with the exception class name.
+Observers are called in the thread that ran the phase, so must be thread-safe.
+With no observers, timing costs little more than a function call.
+
+Metrics is an observer aggregating counters and latency histograms:
+
+    with metrics.Metrics() as m:
+        for device in upnp.discover():
+            ...
+    print(m.snapshot())
+"""
+
+import bisect
+import contextlib
+import enum
+import logging
+import threading
+import time
+import typing as t
+
+log = logging.getLogger(__name__)
+
+
+# noinspection PyPep8Naming
+class PHASE(str, enum.Enum):
+    """Instrumented phases, and the labels they are reported with"""
+    SEARCH      = 'search'       # discover() until it ends: target, devices
+    DESCRIPTION = 'description'  # Download and parse of a rootDesc or SCPD: url
+    DEVICE      = 'device'       # Device(), with its SCPDs unless lazy: device
+    SERVICE     = 'service'      # Service.load(), with its SCPD if needed: device, service
+    SOAP        = 'soap'         # Action.call(): device, service, action. SOAPCall(): url, action
+
+
+Labels = t.Dict[str, str]
+Observer = t.Callable[[PHASE, float, Labels], None]
+
+_observers: t.List[Observer] = []
+
+
+def subscribe(observer:Observer) -> None:
+    _observers.append(observer)
+
+
+def unsubscribe(observer:Observer) -> None:
+    _observers.remove(observer)
+
+
+def record(phase:PHASE, seconds:float, **labels:str) -> None:
+    """Report a timed <phase> to all observers"""
+    for observer in list(_observers):
+        try:
+            observer(phase, seconds, labels)
+        except Exception as e:
+            log.exception("Error in metrics observer %r: %s", observer, e)
+
+
+@contextlib.contextmanager
+def timer(phase:PHASE, **labels:str) -> t.Iterator[Labels]:
+    """Time the enclosed block as <phase>. Labels can be added to the yielded dict"""
+    if not _observers:
+        yield labels
+        return
+    start = time.perf_counter()
+    try:
+        yield labels
+    except Exception as e:
+        labels['error'] = type(e).__name__
+        raise
+    finally:
+        record(phase, time.perf_counter() - start, **labels)
+
+
+class Histogram:
+    """Latency histogram, with cumulative counts of values up to each bound"""
+    def __init__(self, bounds:t.Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value:float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip((*map(str, self.bounds), '+Inf'), self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+class Metrics:
+    """Observer counting phases, errors and their latency histograms
+
+    Series are kept per phase and the values of the <labels> names, if any.
+    Other labels are ignored, as URLs and such could create too many series.
+    Subscribes itself on start() and unsubscribes on stop(), and can also be
+    used as a context manager.
+    """
+    BUCKETS: t.Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                                    0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, *, labels:t.Sequence[str]=(), buckets:t.Sequence[float]=BUCKETS):
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._histograms: t.Dict[t.Tuple[PHASE, tuple], Histogram] = {}
+        self._errors: t.Dict[t.Tuple[PHASE, tuple], int] = {}
+
+    def __call__(self, phase:PHASE, seconds:float, labels:Labels) -> None:
+        key = (phase, tuple(labels.get(_, "") for _ in self.labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if 'error' in labels:
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def snapshot(self) -> t.List[dict]:
+        """Current series, as JSON-serializable dicts"""
+        with self._lock:
+            return [{
+                'phase': phase.value,
+                'labels': dict(zip(self.labels, values)),
+                'errors': self._errors.get((phase, values), 0),
+                **histogram.to_dict(),
+            } for (phase, values), histogram in self._histograms.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._errors.clear()
+
+    def start(self) -> 'Metrics':
+        subscribe(self)
+        return self
+
+    def stop(self) -> None:
+        unsubscribe(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
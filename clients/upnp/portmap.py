@@ -0,0 +1,626 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""Port mappings manager, with bulk operations and automatic lease renewal,
+and an indexed local copy of the gateway port mapping table
+
+    with upnp.PortMapper.from_device(gateway) as mapper:
+        failed = mapper.add_many(upnp.PortMapping(port, 'TCP', port, '192.168.1.10',
+                                                  "game", lease=3600)
+                                 for port in range(27000, 27100))
+        ...  # Mappings are renewed in background until stop(), then deleted
+
+    table = upnp.PortMappingTable.from_device(gateway, interval=60)
+    table.refresh()
+    table.watch()  # Also checked every minute, see start()
+    if not table.taken(8080, 'TCP'):
+        ...
+"""
+
+import concurrent.futures
+import contextlib
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import typing as t
+
+from . import util
+from .common import SOAP_WORKERS, UpnpError, UpnpValueError, UpnpAttributeError, SOAPError
+
+if t.TYPE_CHECKING:
+    from .device import Device, Service
+    from .events import EventServer, Subscription
+
+log = logging.getLogger(__name__)
+
+SERVICE_NAMES = ('WANIPConnection', 'WANPPPConnection')
+
+# Leases are renewed at a random fraction of their duration within this range,
+# so mappings added together do not all renew at once
+PORTMAP_RENEW_AT: t.Tuple[float, float] = (0.7, 0.85)
+PORTMAP_RETRIES:  int   = 3    # Retries of calls failing with a transient error
+PORTMAP_BACKOFF:  float = 0.5  # Seconds before the first retry, doubled on each one
+
+# REF: IGD2 WANIPConnection:2, 2.4.16: 501 ActionFailed may succeed if retried
+TRANSIENT_FAULTS: t.Set[int] = {501}
+# Ends of GetGenericPortMappingEntry: 713 SpecifiedArrayIndexInvalid by spec,
+# 714 NoSuchEntryInArray by some gateways
+END_FAULTS: t.Set[int] = {713, 714}
+
+Key = t.Tuple[str, int, str]  # Remote host, external port and protocol
+
+
+def transient(error:UpnpError) -> bool:
+    """If a call failing with <error> could succeed if retried"""
+    if isinstance(error, SOAPError):
+        return error.code in TRANSIENT_FAULTS
+    # Plain UpnpError is raised on network errors and timeouts
+    return not isinstance(error, (UpnpValueError, UpnpAttributeError))
+
+
+class PortMapping(t.NamedTuple):
+    """Port mapping, as in AddPortMapping arguments. A <lease> of 0 is permanent"""
+    external_port:   int
+    protocol:        str
+    internal_port:   int
+    internal_client: str
+    description:     str  = ""
+    lease:           int  = 0
+    remote_host:     str  = ""
+    enabled:         bool = True
+
+    @classmethod
+    def from_result(cls, result:'util.NamedTuple', **kwargs) -> 'PortMapping':
+        """Mapping from the result of Get*PortMappingEntry, completed by <kwargs>"""
+        fields = {k: result[v] for k, v in (
+            ('remote_host',     'NewRemoteHost'),
+            ('external_port',   'NewExternalPort'),
+            ('protocol',        'NewProtocol'),
+            ('internal_port',   'NewInternalPort'),
+            ('internal_client', 'NewInternalClient'),
+            ('description',     'NewPortMappingDescription'),
+            ('lease',           'NewLeaseDuration'),
+            ('enabled',         'NewEnabled'),
+        ) if v in result._fields}
+        fields.update(kwargs)
+        fields['remote_host'] = fields.get('remote_host') or ""
+        fields['description'] = fields.get('description') or ""
+        fields['lease'] = fields.get('lease') or 0
+        return cls(**fields)
+
+    @property
+    def key(self) -> Key:
+        """The triple identifying a mapping in a gateway"""
+        return self.remote_host, self.external_port, self.protocol.upper()
+
+    def arguments(self, key_only:bool=False) -> t.Dict[str, t.Any]:
+        """Arguments of AddPortMapping, or just the key ones for the other actions"""
+        args = {
+            'NewRemoteHost':   self.remote_host,
+            'NewExternalPort': self.external_port,
+            'NewProtocol':     self.protocol.upper(),
+        }
+        if not key_only:
+            args.update({
+                'NewInternalPort':           self.internal_port,
+                'NewInternalClient':         self.internal_client,
+                'NewEnabled':                self.enabled,
+                'NewPortMappingDescription': self.description,
+                'NewLeaseDuration':          self.lease,
+            })
+        return args
+
+    def __str__(self):
+        return (f"{self.remote_host or '*'}:{self.external_port}/{self.protocol.upper()}"
+                f" -> {self.internal_client}:{self.internal_port}")
+
+
+class PortMapper:
+    """Port mappings added to a WANIPConnection or WANPPPConnection <service>
+
+    Bulk operations run up to <workers> calls at once. Calls failing with a
+    transient error are retried up to <retries> times, with exponential backoff.
+    Mappings with a lease are renewed by a background thread, started on the
+    first of them, before they expire. See PORTMAP_RENEW_AT.
+    stop() deletes all mappings added by this instance, unless asked not to.
+    Added and deleted mappings are also applied to <table>, if given.
+    Can also be used as a context manager.
+    """
+    @classmethod
+    def from_device(cls, device:'Device', **kwargs) -> 'PortMapper':
+        """Manager of the first WAN connection service in <device>"""
+        for service in device.services.values():
+            if service.name in SERVICE_NAMES:
+                return cls(service, **kwargs)
+        raise UpnpError(f"No WAN connection service in {device}")
+
+    def __init__(self, service:'Service', *, workers:int=SOAP_WORKERS,
+                 retries:int=PORTMAP_RETRIES, table:'PortMappingTable'=None):
+        self.service = service
+        self.workers = workers
+        self.retries = retries
+        self.table = table
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._mappings: t.Dict[Key, PortMapping] = {}
+        self._renewals: t.Dict[Key, float] = {}
+        self._heap: t.List[t.Tuple[float, int, Key]] = []  # Lazily pruned
+        self._counter = itertools.count()  # Heap tie-breaker
+        self._busy: t.Set[Key] = set()  # Being added, deleted or renewed
+        self._thread: t.Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def mappings(self) -> t.List[PortMapping]:
+        with self._lock:
+            return list(self._mappings.values())
+
+    def call(self, action:str, **kwargs) -> 'util.NamedTuple':
+        """Call <action> of the service, retrying on transient errors"""
+        for attempt in itertools.count():
+            try:
+                return self.service.actions[action](**kwargs)
+            except UpnpError as e:
+                if attempt >= self.retries or not transient(e):
+                    raise
+                delay = PORTMAP_BACKOFF * 2 ** attempt
+                log.debug("Retrying %s in %.1f seconds: %s", action, delay, e)
+                time.sleep(delay)
+
+    def add(self, mapping:PortMapping) -> PortMapping:
+        """Add <mapping>, renewing it if it has a lease. Return it as added
+
+        Gateways that only support permanent mappings get one with no lease.
+        The protocol is upper-cased, as gateways report it.
+        """
+        mapping = mapping._replace(protocol=mapping.protocol.upper())
+        with self._exclusive(mapping.key):
+            return self._add(mapping)
+
+    def _add(self, mapping:PortMapping) -> PortMapping:
+        try:
+            self.call('AddPortMapping', **mapping.arguments())
+        except SOAPError as e:
+            # REF: IGD1 WANIPConnection:1, 2.4.16: 725 OnlyPermanentLeasesSupported
+            if e.code != 725 or not mapping.lease:
+                raise
+            log.info("Only permanent mappings supported, adding %s with no lease", mapping)
+            mapping = mapping._replace(lease=0)
+            self.call('AddPortMapping', **mapping.arguments())
+        with self._lock:
+            self._mappings[mapping.key] = mapping
+            self._schedule(mapping)
+        if self.table is not None:
+            self.table.apply(mapping.key, mapping)
+        return mapping
+
+    def delete(self, mapping:PortMapping) -> None:
+        """Delete <mapping>, and stop renewing it. Already deleted ones are ignored"""
+        with self._exclusive(mapping.key):
+            with self._lock:
+                self._mappings.pop(mapping.key, None)
+                self._renewals.pop(mapping.key, None)
+            try:
+                self.call('DeletePortMapping', **mapping.arguments(key_only=True))
+            except SOAPError as e:
+                # 714 NoSuchEntryInArray: expired, or deleted by someone else
+                if e.code != 714:
+                    raise
+        if self.table is not None:
+            self.table.apply(mapping.key, None)
+
+    @contextlib.contextmanager
+    def _exclusive(self, key:Key) -> t.Iterator[None]:
+        # Calls for the same mapping run one at a time, so a renewal can not
+        # add back a mapping deleted meanwhile, nor overwrite a newer one
+        with self._lock:
+            while key in self._busy:
+                self._wakeup.wait()
+            self._busy.add(key)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._busy.discard(key)
+                self._wakeup.notify_all()
+
+    def add_many(self, mappings:t.Iterable[PortMapping],
+                 ) -> t.List[t.Tuple[PortMapping, UpnpError]]:
+        """Add <mappings> concurrently, returning the ones that failed and why"""
+        return self._many(self.add, mappings)
+
+    def delete_many(self, mappings:t.Iterable[PortMapping]=None,
+                    ) -> t.List[t.Tuple[PortMapping, UpnpError]]:
+        """Delete <mappings> concurrently, by default all added ones. See add_many()"""
+        return self._many(self.delete, self.mappings if mappings is None else mappings)
+
+    def _many(self, func:t.Callable[[PortMapping], t.Any],
+              mappings:t.Iterable[PortMapping]) -> t.List[t.Tuple[PortMapping, UpnpError]]:
+        def run(mapping:PortMapping) -> t.Optional[UpnpError]:
+            try:
+                func(mapping)
+            except UpnpError as e:
+                log.warning("Error in %s of %s: %s", func.__name__, mapping, e)
+                return e
+            return None
+
+        mappings = list(mappings)
+        if not mappings:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=util.clamp(self.workers, 1, len(mappings))
+        ) as pool:
+            return [(mapping, error) for mapping, error in
+                    zip(mappings, pool.map(run, mappings)) if error is not None]
+
+    def _schedule(self, mapping:PortMapping, delay:float=None) -> None:
+        # Lock must be held
+        if not mapping.lease:
+            self._renewals.pop(mapping.key, None)
+            return
+        if delay is None:
+            delay = mapping.lease * random.uniform(*PORTMAP_RENEW_AT)
+        renew = time.monotonic() + delay
+        self._renewals[mapping.key] = renew
+        heapq.heappush(self._heap, (renew, next(self._counter), mapping.key))
+        self._wakeup.notify()
+        if not self._stop.is_set():
+            self.start()
+
+    def _renew_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._stop.is_set() and (
+                    not self._heap or self._heap[0][0] > time.monotonic()
+                ):
+                    self._wakeup.wait(self._heap[0][0] - time.monotonic()
+                                      if self._heap else None)
+                if self._stop.is_set():
+                    return
+                renew, _, key = heapq.heappop(self._heap)
+                if self._renewals.get(key) != renew:
+                    continue  # Deleted or renewed meanwhile
+            self._renew(key, renew)
+
+    def _renew(self, key:Key, renew:float) -> None:
+        with self._exclusive(key):
+            with self._lock:
+                if self._renewals.get(key) != renew:
+                    return  # Deleted or added again while waiting
+                mapping = self._mappings[key]
+            try:
+                self._add(mapping)
+            except UpnpError as e:
+                # Try again halfway to the expiration
+                log.warning("Error renewing port mapping %s: %s", mapping, e)
+                with self._lock:
+                    self._schedule(mapping, mapping.lease * (1 - PORTMAP_RENEW_AT[1]) / 2)
+
+    def start(self) -> 'PortMapper':
+        """Renew leases in a background thread. Called by add() when needed, until stop()"""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._renew_loop,
+                                                name='PortMapRenewal', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, *, delete:bool=True) -> None:
+        """Stop renewing leases and, if <delete>, delete all added mappings"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+            self._wakeup.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        if delete:
+            self.delete_many()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __repr__(self):
+        return (f'<{self.__class__.__name__}({self.service.device}, {self.service},'
+                f' {len(self._mappings)} mappings)>')
+
+
+class PortMappingDiff(t.NamedTuple):
+    """Changes between two port mapping snapshots, false if none"""
+    added:   t.List[PortMapping]
+    removed: t.List[PortMapping]
+    changed: t.List[t.Tuple[PortMapping, PortMapping]]  # (old, new)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff(old:t.Mapping[Key, PortMapping], new:t.Mapping[Key, PortMapping]) -> PortMappingDiff:
+    """Changes from snapshot <old> to <new>
+
+    Lease countdowns are not changes, nor is the protocol case.
+    """
+    def same(a:PortMapping, b:PortMapping) -> bool:
+        return (a._replace(lease=0, protocol=a.protocol.upper()) ==
+                b._replace(lease=0, protocol=b.protocol.upper()))
+
+    return PortMappingDiff(
+        added=[new[_] for _ in new.keys() - old.keys()],
+        removed=[old[_] for _ in old.keys() - new.keys()],
+        changed=[(old[_], new[_]) for _ in old.keys() & new.keys() if not same(old[_], new[_])],
+    )
+
+
+class PortMappingTable:
+    """Local copy of the port mapping table of a gateway <service>
+
+    Mappings are indexed by key, by protocol and external port, and by internal
+    client, so lookups are answered from memory in constant time. refresh()
+    reads the whole table, with up to <workers> calls at once, update() only
+    the entries added or deleted since, refresh_entry() a single mapping, and
+    apply() records a change made by this control point. All return what
+    changed, which is also passed to each of <callbacks>.
+
+    After watch(), the table is updated whenever the service events a new
+    PortMappingNumberOfEntries. Some gateways event nothing at all, so with an
+    <interval>, start() also checks the number of entries that often in a
+    background thread. Entries changing in place are neither evented nor
+    counted, so refresh() periodically if needed. Can also be used as a
+    context manager.
+    """
+    @classmethod
+    def from_device(cls, device:'Device', **kwargs) -> 'PortMappingTable':
+        """Table of the first WAN connection service in <device>"""
+        for service in device.services.values():
+            if service.name in SERVICE_NAMES:
+                return cls(service, **kwargs)
+        raise UpnpError(f"No WAN connection service in {device}")
+
+    def __init__(self, service:'Service', *, workers:int=SOAP_WORKERS,
+                 interval:float=None):
+        self.service = service
+        self.workers = workers
+        self.interval = interval
+        self.callbacks: t.List[t.Callable[[PortMappingDiff], None]] = []
+        self.subscription: t.Optional['Subscription'] = None
+        self.updated: t.Optional[float] = None  # Monotonic time of last read
+        self._lock = threading.Lock()
+        self._reading = threading.RLock()  # So reads do not interleave
+        self._mappings: t.Dict[Key, PortMapping] = {}
+        self._ports: t.Dict[t.Tuple[str, int], t.Set[Key]] = {}  # By protocol, port
+        self._clients: t.Dict[str, t.Set[Key]] = {}
+        self._thread: t.Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def refresh(self) -> PortMappingDiff:
+        """Read the whole table from the gateway"""
+        with self._reading:
+            mappings = {_.key: _ for _ in self._read(itertools.count())}
+            with self._lock:
+                changes = diff(self._mappings, mappings)
+                for mapping in changes.removed:
+                    self._remove(mapping.key)
+                for mapping in itertools.chain(changes.added, (_[1] for _ in changes.changed)):
+                    self._add(mapping)
+                self.updated = time.monotonic()
+        return self._notify(changes)
+
+    def update(self, count:int=None) -> PortMappingDiff:
+        """Read only the entries added or deleted since the last read
+
+        <count> is the new number of entries in the gateway, as evented. If
+        lower than the table size, all known mappings are read again by key,
+        and if higher, the entries past the known ones are read by index, as
+        gateways append new mappings to their table. With no <count>, the
+        entries around the end of the table are probed one at a time instead,
+        so an unchanged table costs 2 calls. Falls back to refresh() if the
+        gateway does not match the table afterwards.
+        """
+        with self._reading:
+            size = len(self)
+            if count is None:
+                shrunk = bool(size) and self._index(size - 1) is None
+            else:
+                shrunk = count < size
+            entries: t.Dict[Key, t.Optional[PortMapping]] = {}
+            if shrunk:
+                keys = list(self.snapshot())
+                with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=util.clamp(self.workers, 1, len(keys))
+                ) as pool:
+                    entries.update(zip(keys, pool.map(self._entry, keys)))
+                size = sum(_ is not None for _ in entries.values())
+            if count is None or count > size:
+                if count is None:
+                    # Probed alone, as reading keeps <workers> calls in flight
+                    first = self._index(size)
+                    added = () if first is None else itertools.chain(
+                        (first,), self._read(itertools.count(size + 1)))
+                else:
+                    added = self._read(range(size, count))
+                for mapping in added:
+                    if mapping.key in self or mapping.key in entries:
+                        log.debug("Port mappings of %s were not appended, reading all",
+                                  self.service.device)
+                        return self.refresh()
+                    entries[mapping.key] = mapping
+            changes = self._update(entries)
+            self.updated = time.monotonic()
+            if count is not None and len(self) != count:
+                log.debug("Port mappings of %s do not add up to %s, reading all",
+                          self.service.device, count)
+                return self.refresh()
+        return changes
+
+    def refresh_entry(self, external_port:int, protocol:str,
+                      remote_host:str="") -> PortMappingDiff:
+        """Read a single mapping from the gateway"""
+        key = (remote_host, external_port, protocol.upper())
+        return self.apply(key, self._entry(key))
+
+    def apply(self, key:Key, mapping:t.Optional[PortMapping]) -> PortMappingDiff:
+        """Set the mapping at <key>, or remove it if None"""
+        return self._update({key: mapping})
+
+    def _read(self, indexes:t.Iterable[int]) -> t.Iterator[PortMapping]:
+        # Mappings at <indexes>, until the end of the gateway table
+        action = self.service.actions['GetGenericPortMappingEntry']
+        for result in action.call_many(({'NewPortMappingIndex': _} for _ in indexes),
+                                       workers=self.workers, stop_on=END_FAULTS):
+            yield PortMapping.from_result(result)
+
+    def _index(self, index:int) -> t.Optional[PortMapping]:
+        return next(self._read((index,)), None)
+
+    def _entry(self, key:Key) -> t.Optional[PortMapping]:
+        remote_host, external_port, protocol = key
+        try:
+            result = self.service.actions['GetSpecificPortMappingEntry'](
+                NewRemoteHost=remote_host, NewExternalPort=external_port,
+                NewProtocol=protocol)
+        except SOAPError as e:
+            if e.code != 714:  # NoSuchEntryInArray
+                raise
+            return None
+        return PortMapping.from_result(result, remote_host=remote_host,
+                                       external_port=external_port, protocol=protocol)
+
+    def _update(self, entries:t.Mapping[Key, t.Optional[PortMapping]]) -> PortMappingDiff:
+        # Set the mappings in <entries>, removing the None ones
+        with self._lock:
+            old = {_: self._mappings[_] for _ in entries if _ in self._mappings}
+            new = {k: v for k, v in entries.items() if v is not None}
+            changes = diff(old, new)
+            for key in old:
+                self._remove(key)
+            for mapping in new.values():
+                self._add(mapping)
+        return self._notify(changes)
+
+    def _add(self, mapping:PortMapping) -> None:
+        key = mapping.key
+        self._mappings[key] = mapping._replace(protocol=key[2])
+        self._ports.setdefault((key[2], key[1]), set()).add(key)
+        self._clients.setdefault(mapping.internal_client, set()).add(key)
+
+    def _remove(self, key:Key) -> None:
+        mapping = self._mappings.pop(key)
+        for index, value in ((self._ports, (key[2], key[1])),
+                             (self._clients, mapping.internal_client)):
+            index[value].discard(key)
+            if not index[value]:
+                del index[value]
+
+    def _notify(self, changes:PortMappingDiff) -> PortMappingDiff:
+        if changes:
+            for callback in list(self.callbacks):
+                try:
+                    callback(changes)
+                except Exception as e:
+                    log.exception("Error in port mapping callback %r: %s", callback, e)
+        return changes
+
+    def watch(self, *, server:'EventServer'=None) -> 'Subscription':
+        """Update the table on PortMappingNumberOfEntries events"""
+        if self.subscription is None or not self.subscription.active:
+            self.subscription = self.service.subscribe(self._event, server=server)
+        return self.subscription
+
+    def unwatch(self) -> None:
+        if self.subscription is not None:
+            self.subscription.unsubscribe()
+            self.subscription = None
+
+    # noinspection PyUnusedLocal
+    def _event(self, subscription:'Subscription', variables:t.Dict[str, t.Any]) -> None:
+        if 'PortMappingNumberOfEntries' not in variables:
+            return
+        try:
+            count = int(variables['PortMappingNumberOfEntries'])
+        except (TypeError, ValueError):
+            count = None  # Probed by update()
+        self._check(count)
+
+    def _check(self, count:int=None) -> None:
+        try:
+            changes = self.update(count)
+        except UpnpError as e:
+            log.warning("Error updating port mappings of %s: %s", self.service.device, e)
+            return
+        if changes:
+            log.debug("Port mappings of %s changed: %s", self.service.device, changes)
+
+    def _poll(self) -> None:
+        checked = self.updated or 0.0
+        while not self._stop.wait(max(0.0, checked + self.interval - time.monotonic())):
+            if self.updated is not None and self.updated > checked:
+                checked = self.updated  # Read meanwhile, such as on an event
+                continue
+            self._check()
+            checked = time.monotonic()
+
+    def start(self) -> 'PortMappingTable':
+        """Check the number of entries every <interval> seconds, if set, until stop()"""
+        if self.interval and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._poll,
+                                            name='PortMapTable', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop checking the number of entries, and unwatch()"""
+        thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.unwatch()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def get(self, external_port:int, protocol:str,
+            remote_host:str="") -> t.Optional[PortMapping]:
+        return self._mappings.get((remote_host, external_port, protocol.upper()))
+
+    def taken(self, external_port:int, protocol:str) -> bool:
+        """If <external_port> is mapped, for any remote host"""
+        return bool(self._ports.get((protocol.upper(), external_port)))
+
+    def by_port(self, external_port:int, protocol:str) -> t.List[PortMapping]:
+        with self._lock:
+            return [self._mappings[_] for _ in
+                    self._ports.get((protocol.upper(), external_port), ())]
+
+    def by_client(self, internal_client:str) -> t.List[PortMapping]:
+        with self._lock:
+            return [self._mappings[_] for _ in self._clients.get(internal_client, ())]
+
+    def snapshot(self) -> t.Dict[Key, PortMapping]:
+        """Copy of the current mappings, by key, to diff() with later ones"""
+        with self._lock:
+            return dict(self._mappings)
+
+    def __contains__(self, key:Key) -> bool:
+        return key in self._mappings
+
+    def __iter__(self) -> t.Iterator[PortMapping]:
+        with self._lock:
+            return iter(list(self._mappings.values()))
+
+    def __len__(self) -> int:
+        return len(self._mappings)
+
+    def __repr__(self):
+        return (f'<{self.__class__.__name__}({self.service.device}, {self.service},'
+                f' {len(self)} mappings)>')
@@ -0,0 +1,248 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""Passive SSDP listener and live registry of advertised devices and services"""
+
+import enum
+import heapq
+import logging
+import selectors
+import socket
+import threading
+import time
+import typing as t
+
+from .common import NTS, SSDP_ADDR, SSDP_BUFFSIZE, SSDP_PORT
+from .ssdp import SSDP
+
+log = logging.getLogger(__name__)
+
+# Used when an ssdp:alive has no valid CACHE-CONTROL. Spec minimum is 1800
+REGISTRY_MAX_AGE: int = 1800
+
+
+# noinspection PyPep8Naming
+class EVENT(str, enum.Enum):
+    """Registry changes, as notified to its callbacks"""
+    ADDED   = 'added'
+    UPDATED = 'updated'
+    REMOVED = 'removed'  # By ssdp:byebye
+    EXPIRED = 'expired'  # By CACHE-CONTROL max-age
+
+
+Callback = t.Callable[[EVENT, SSDP], None]
+
+
+class Registry:
+    """Live SSDP advertisements, keyed by USN
+
+    Fed by a Listener with NOTIFY messages, and possibly by search responses,
+    see update(). Entries expire after their CACHE-CONTROL max-age unless
+    re-advertised. Callbacks are called with an EVENT and the SSDP entry, in
+    the thread that made the change and outside the registry lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: t.Dict[str, SSDP] = {}
+        self._expires: t.Dict[str, float] = {}
+        self._targets: t.Dict[str, t.Set[str]] = {}  # ST/NT -> USNs
+        self._heap: t.List[t.Tuple[float, str]] = []  # Lazily pruned
+        self.callbacks: t.List[Callback] = []
+
+    def subscribe(self, callback:Callback) -> None:
+        self.callbacks.append(callback)
+
+    def unsubscribe(self, callback:Callback) -> None:
+        self.callbacks.remove(callback)
+
+    def update(self, ssdp:SSDP, now:float=None) -> t.Optional[EVENT]:
+        """Apply an advertisement or search response, returning the change if any"""
+        usn = ssdp.usn
+        if not usn:
+            log.debug("Ignoring SSDP message without USN: %s", ssdp)
+            return None
+        now = time.monotonic() if now is None else now
+        nts = ssdp.headers.get('NTS', NTS.ALIVE)
+
+        with self._lock:
+            old = self._entries.get(usn)
+            if nts == NTS.BYEBYE:
+                if old is None:
+                    return None
+                self._remove(usn)
+                event, ssdp = EVENT.REMOVED, old
+            elif nts == NTS.UPDATE:
+                # Same device, about to change its BOOTID. Not a new entry
+                if old is None:
+                    return None
+                old.headers['BOOTID.UPNP.ORG'] = ssdp.headers.get(
+                    'NEXTBOOTID.UPNP.ORG', old.headers.get('BOOTID.UPNP.ORG', ''))
+                event, ssdp = EVENT.UPDATED, old
+            elif nts == NTS.ALIVE:
+                self._add(ssdp, now + (ssdp.max_age or REGISTRY_MAX_AGE))
+                if old is None:
+                    event = EVENT.ADDED
+                elif any(old.headers.get(_) != ssdp.headers.get(_) for _ in (
+                    'LOCATION', 'BOOTID.UPNP.ORG', 'CONFIGID.UPNP.ORG',
+                )):
+                    event = EVENT.UPDATED
+                else:
+                    return None  # Just a refresh
+            else:
+                log.debug("Ignoring unknown NTS %r: %s", nts, ssdp)
+                return None
+
+        self._notify(event, ssdp)
+        return event
+
+    def expire(self, now:float=None) -> t.List[SSDP]:
+        """Remove and return entries past their max-age"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires, usn = heapq.heappop(self._heap)
+                if self._expires.get(usn) == expires:  # Not refreshed since
+                    expired.append(self._entries[usn])
+                    self._remove(usn)
+        for ssdp in expired:
+            self._notify(EVENT.EXPIRED, ssdp)
+        return expired
+
+    def next_expiry(self) -> t.Optional[float]:
+        """Monotonic time of the earliest possible expiration, if any"""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def get(self, usn:str, default:SSDP=None) -> t.Optional[SSDP]:
+        return self._entries.get(usn, default)
+
+    def find(self, target:str) -> t.List[SSDP]:
+        """Entries advertising a given device or service type (ST/NT)"""
+        with self._lock:
+            return [self._entries[_] for _ in self._targets.get(target, ())]
+
+    def _add(self, ssdp:SSDP, expires:float) -> None:
+        usn = ssdp.usn
+        if usn in self._entries:
+            self._targets[self._entries[usn].target].discard(usn)
+        self._entries[usn] = ssdp
+        self._expires[usn] = expires
+        self._targets.setdefault(ssdp.target, set()).add(usn)
+        heapq.heappush(self._heap, (expires, usn))
+
+    def _remove(self, usn:str) -> None:
+        ssdp = self._entries.pop(usn)
+        del self._expires[usn]
+        self._targets[ssdp.target].discard(usn)
+
+    def _notify(self, event:EVENT, ssdp:SSDP) -> None:
+        for callback in list(self.callbacks):
+            try:
+                callback(event, ssdp)
+            except Exception as e:
+                log.exception("Error in registry callback %r: %s", callback, e)
+
+    def __getitem__(self, usn:str) -> SSDP:
+        return self._entries[usn]
+
+    def __contains__(self, usn:str) -> bool:
+        return usn in self._entries
+
+    def __iter__(self) -> t.Iterator[SSDP]:
+        with self._lock:
+            return iter(list(self._entries.values()))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}({len(self)} entries)>'
+
+
+class Listener:
+    """Passive SSDP listener, feeding NOTIFY advertisements to a Registry
+
+    Joins the SSDP multicast group on each address in <interfaces>, or on the
+    interface chosen by the OS, and runs in a background thread after start().
+    Can also be used as a context manager.
+    """
+    def __init__(self, registry:Registry=None, *,
+                 interfaces:t.Iterable[str]=(), port:int=SSDP_PORT):
+        self.registry = registry if registry is not None else Registry()
+        self.interfaces = list(dict.fromkeys(interfaces)) or [""]
+        self.port = port
+        self._stop = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+
+    def open(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            # Other control points (and this one) may listen at the same time
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('', self.port))
+            for interface in self.interfaces:
+                mreq = socket.inet_aton(SSDP_ADDR) + socket.inet_aton(interface or '0.0.0.0')
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def run(self) -> None:
+        """Listen until stop(), blocking the current thread"""
+        self._serve(self.open())
+
+    def _serve(self, sock:socket.socket) -> None:
+        with sock, selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            log.info("Listening to SSDP advertisements on %s:%s", SSDP_ADDR, self.port)
+            while not self._stop.is_set():
+                # Wake up at least every second to check for stop()
+                wait = 1.0
+                expiry = self.registry.next_expiry()
+                if expiry is not None:
+                    wait = min(wait, max(expiry - time.monotonic(), 0))
+                if selector.select(wait):
+                    try:
+                        data, (addr, port) = sock.recvfrom(SSDP_BUFFSIZE)
+                    except BlockingIOError:
+                        continue
+                    self.handle(data, addr)
+                self.registry.expire()
+
+    def handle(self, data:bytes, addr:str) -> None:
+        # Also receives M-SEARCH requests from other control points
+        if not data.startswith(b'NOTIFY '):
+            return
+        try:
+            ssdp = SSDP(data.decode(), addr)
+        except UnicodeDecodeError as e:
+            log.debug("Ignoring invalid advertisement from %s: %s", addr, e)
+            return
+        log.debug("Incoming advertisement from %s\n%s", addr, ssdp.data)
+        self.registry.update(ssdp)
+
+    def start(self) -> 'Listener':
+        """Listen in a background thread. Socket errors are raised here"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._serve, args=(self.open(),),
+                                        name='SSDPListener', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout:float=None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
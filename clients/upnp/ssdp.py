@@ -0,0 +1,383 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""SSDP discovery"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import logging
+import re
+import selectors
+import socket
+import time
+import typing as t
+
+from . import metrics, util
+from .common import (
+    FETCH_WORKERS,
+    SEARCH_TARGET,
+    SSDP_ADDR,
+    SSDP_BUFFSIZE,
+    SSDP_CPUUID,
+    SSDP_MAX_MX,
+    SSDP_PORT,
+    SSDP_SOURCE_PORT,
+    SSDP_TIMEOUT,
+    SSDP_TTL,
+    SSDP_USER_AGENT,
+    UpnpError,
+    UpnpValueError,
+)
+from .device import Device
+from .transport import Transport
+
+log = logging.getLogger(__name__)
+
+# Headers needed to reject a search reply, matched on the raw packet
+_re_location = re.compile(rb'\nLOCATION[ \t]*:[ \t]*([^\r\n]*)', re.IGNORECASE)
+_re_st       = re.compile(rb'\nST[ \t]*:[ \t]*([^\r\n]*)', re.IGNORECASE)
+
+
+def _peek(regex:t.Pattern, data:bytes) -> bytes:
+    match = regex.search(data)
+    return match.group(1).rstrip() if match else b''
+
+
+class SSDP:
+    """Device/Service from SSDP M-Search response or NOTIFY advertisement"""
+    __slots__ = ('data', 'headers', 'interface', 'addr')
+
+    def __init__(self, data:str, addr:str="", interface:str=""):
+        self.data = data
+        self.headers = util.parse_headers(data)
+        self.interface = interface  # Local address it was received on, if known
+
+        loc = self.headers.get('LOCATION')
+        locaddr = util.hostname(loc)
+        if addr and loc and addr != locaddr:
+            log.warning("Address and Location mismatch: %s, %s", addr, loc)
+        self.addr = addr or locaddr
+
+    @property
+    def info(self):
+        keys = ['SERVER', 'LOCATION', 'USN']
+        if not self.is_root:
+            keys.append('NT' if self.is_notify else 'ST')
+        if self.is_notify:
+            keys.append('NTS')
+        return {_: self.headers.get(_) for _ in keys}
+
+    @property
+    def is_notify(self) -> bool:
+        return self.data.startswith('NOTIFY ')
+
+    @property
+    def target(self) -> str:
+        """Search target (ST) of a search response, or NT of an advertisement"""
+        return self.headers.get('ST') or self.headers.get('NT', '')
+
+    @property
+    def is_root(self):
+        return self.target == SEARCH_TARGET.ROOT
+
+    @property
+    def usn(self) -> str:
+        return self.headers.get('USN', '')
+
+    @property
+    def max_age(self) -> int:
+        """Seconds the advertisement is valid for, from CACHE-CONTROL. 0 if unknown"""
+        match = re.search(r'max-age\s*=\s*(\d+)', self.headers.get('CACHE-CONTROL', ''))
+        return int(match.group(1)) if match else 0
+
+    @property
+    def udn(self) -> str:
+        return self.usn.split('::', 1)[0]
+
+    @property
+    def cache_tag(self) -> t.Optional[tuple]:
+        """Identity of the device descriptions, if advertised. See DescriptionCache
+
+        REF: UDA2/1.2.2: CONFIGID.UPNP.ORG changes whenever any description
+        document of the device changes, BOOTID.UPNP.ORG when it reboots.
+        """
+        config_id = self.headers.get('CONFIGID.UPNP.ORG')
+        if not config_id:
+            return None
+        return self.udn, self.headers.get('BOOTID.UPNP.ORG', ''), config_id
+
+    def __repr__(self):
+        desc = ', '.join(('='.join((k.lower(), repr(v))) for k, v in self.info.items()))
+        return f'<{self.__class__.__name__}({desc})>'
+
+
+class MSearch:
+    """An SSDP M-SEARCH request and the filtering of its replies
+
+    Shared by the blocking discover() and its asyncio counterpart in aio.
+    Multicast is used by default even for unicast addresses, as some devices
+    (namely old TP-Link routers) only reply to multicast on 239.255.255.250
+
+    The search is sent from each address in <interfaces>, one socket each.
+    By default, a single socket uses the interface chosen by the OS.
+
+    <deadline>, <max_results> and <until> set when discovery should stop,
+    see found() and expired().
+    """
+    def __init__(
+            self,
+            search_target:t.Union[str, SEARCH_TARGET]=SEARCH_TARGET.ALL, *,
+            dest_addr:str=SSDP_ADDR,
+            timeout:int=SSDP_TIMEOUT,
+            ttl:int=SSDP_TTL,
+            unicast:bool=False,
+            source_port:int=SSDP_SOURCE_PORT,
+            interfaces:t.Iterable[str]=(),
+            deadline:float=0,
+            max_results:int=0,
+            until:t.Callable[[Device], bool]=None,
+    ):
+        if isinstance(search_target, SEARCH_TARGET):
+            search_target = search_target.value
+
+        if unicast and dest_addr == SSDP_ADDR:
+            log.warning("unicast with the default multicast address makes no sense")
+
+        self.search_target = search_target
+        self._target       = search_target.encode()
+        self.dest_addr     = dest_addr
+        self.unicast       = unicast
+        self.ttl           = ttl
+        self.source_port   = source_port
+        self.interfaces    = list(dict.fromkeys(interfaces)) or [""]
+        self.timeout       = util.clamp(timeout, 1)
+        self.addr          = (dest_addr if unicast else SSDP_ADDR, SSDP_PORT)
+        self.locations:    t.Set[bytes] = set()
+        self.max_results   = max_results
+        self.until         = until
+        self.count         = 0
+        self.end           = (time.monotonic() + deadline) if deadline else None
+        self.start         = time.perf_counter()
+
+        mx = util.clamp(self.timeout, 1, SSDP_MAX_MX)
+        self.data = re.sub(r'[\t ]*\r?\n[\t ]*', '\r\n', f"""
+                M-SEARCH * HTTP/1.1
+                HOST: {SSDP_ADDR}:{SSDP_PORT}
+                MAN: "ssdp:discover"
+                MX: {mx}
+                ST: {search_target}
+                USER-AGENT: {SSDP_USER_AGENT}
+                CPUUID.UPNP.ORG: {SSDP_CPUUID}
+                CPFN.UPNP.ORG: MestreLion UPnP Library
+
+        """.lstrip())
+
+    def open(self, interface:str="") -> socket.socket:
+        """Return a new non-blocking socket on <interface>, ready to send()"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            # Note: TTL has a *very* different meaning on multicast packets!
+            for ttl_type in (socket.IP_TTL, socket.IP_MULTICAST_TTL):
+                sock.setsockopt(socket.IPPROTO_IP, ttl_type, self.ttl)
+            sock.setblocking(False)
+            if interface:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                socket.inet_aton(interface))
+                sock.bind((interface, self.source_port))
+            elif self.source_port:
+                sock.bind((util.get_network_ip(), self.source_port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def send(self, sock:t.Union[socket.socket, asyncio.DatagramTransport],
+             interface:str="") -> None:
+        log.info("Discovering UPnP devices and services%s: %s",
+                 interface and f" on {interface}", self.search_target)
+        log.debug("Broadcasting discovery search to %s:\n%s", self.addr, self.data)
+        sock.sendto(bytes(self.data, 'ascii'), self.addr)
+
+    def reply(self, data:bytes, addr:str, port:int=0, interface:str="") -> t.Optional[SSDP]:
+        """Parse a search response, returning None if it should be ignored
+
+        Devices send one reply per service, and busy networks may send
+        thousands, so duplicated and non-target replies are rejected from
+        the raw packet, before any decoding and header parsing.
+        """
+        location = _peek(_re_location, data)
+        if location in self.locations:
+            return None
+        self.locations.add(location)
+
+        # Some unrelated devices reply to discovery even when setting a
+        # specific ST in M-SEARCH
+        if self.search_target != SEARCH_TARGET.ALL:
+            st = _peek(_re_st, data)
+            if st != self._target:
+                log.warning("Ignoring non-target device from %s: ST=%r, LOCATION=%r",
+                            addr, st.decode(errors='replace'),
+                            location.decode(errors='replace'))
+                return None
+
+        data = data.decode()
+        log.debug("Incoming search response from %s:%s\n%s", addr, port, data)
+        ssdp = SSDP(data, addr, interface)
+
+        # Skip if reply addr does not match requested one on multicast
+        if not (self.unicast or (self.dest_addr in (SSDP_ADDR, ssdp.addr))):
+            return None
+
+        log.info("Discovered: %s", ssdp)
+        return ssdp
+
+    def found(self, device:Device) -> bool:
+        """Count a Device as found, returning True if discovery should stop"""
+        self.count += 1
+        if self.max_results and self.count >= self.max_results:
+            log.debug("Stopping discovery after %d devices", self.count)
+            return True
+        if self.until is not None and self.until(device):
+            log.debug("Stopping discovery after finding %r", device)
+            return True
+        return False
+
+    def expired(self) -> bool:
+        return self.end is not None and time.monotonic() >= self.end
+
+    def finish(self) -> None:
+        """Report the whole discovery as a metrics PHASE.SEARCH"""
+        metrics.record(metrics.PHASE.SEARCH, time.perf_counter() - self.start,
+                       target=self.search_target, devices=str(self.count))
+
+    def remaining(self, timeout:float=None) -> t.Optional[float]:
+        """Seconds left until the deadline, capped to <timeout>. None if neither"""
+        if self.end is None:
+            return timeout
+        remaining = max(self.end - time.monotonic(), 0)
+        return remaining if timeout is None else min(remaining, timeout)
+
+
+def discover(
+        search_target:t.Union[str, SEARCH_TARGET]=SEARCH_TARGET.ALL, *,
+        dest_addr:str=SSDP_ADDR,
+        timeout:int=SSDP_TIMEOUT,
+        ttl:int=SSDP_TTL,
+        unicast:bool=False,
+        source_port:int=SSDP_SOURCE_PORT,
+        interfaces:t.Iterable[str]=(),
+        workers:int=FETCH_WORKERS,
+        transport:Transport=None,
+        lazy:bool=False,
+        keep_xml:bool=True,
+        deadline:float=0,
+        max_results:int=0,
+        until:t.Callable[[Device], bool]=None,
+) -> t.Iterable[Device]:
+    """Send an SSDP M-SEARCH message and return received Devices
+
+    Multicast is used by default even for unicast addresses, as some devices
+    (namely old TP-Link routers) only reply to multicast on 239.255.255.250
+
+    Device descriptions are downloaded concurrently by up to <workers> threads,
+    and Devices are yielded as soon as each one is ready, not in reply order.
+    All HTTP requests, including later SOAP calls on the yielded Devices, go
+    through <transport>, which defaults to the shared Transport.default().
+    With <lazy>, only the rootDesc of each device is downloaded, and without
+    <keep_xml> their XML trees are dropped once read, see Device.
+
+    To search on several networks at once, set <interfaces> to their local IPv4
+    addresses, for example util.get_network_ips() for all of them. Replies from
+    all interfaces are read in a single loop, and each Device is tagged with
+    the one it was found on in Device.interface.
+
+    Discovery ends after <deadline> seconds in total, if set, even if devices
+    keep replying or descriptions are still downloading. It also ends after
+    yielding <max_results> Devices, or the first Device for which <until>
+    returns True, for example:
+
+        until=lambda device: SEARCH_TARGET.WAN_CONNECTION in device.services
+    """
+    search = MSearch(search_target, dest_addr=dest_addr, timeout=timeout, ttl=ttl,
+                     unicast=unicast, source_port=source_port, interfaces=interfaces,
+                     deadline=deadline, max_results=max_results, until=until)
+    with contextlib.ExitStack() as stack:
+        selector = stack.enter_context(selectors.DefaultSelector())
+        for interface in search.interfaces:
+            sock = stack.enter_context(search.open(interface))
+            selector.register(sock, selectors.EVENT_READ, interface)
+            search.send(sock, interface)
+
+        # Each finished fetch writes to this socket pair, so it wakes up the
+        # selector and its Device is yielded right away
+        wakeup, waker = socket.socketpair()
+        for sock in (stack.enter_context(wakeup), stack.enter_context(waker)):
+            sock.setblocking(False)
+        selector.register(wakeup, selectors.EVENT_READ)
+
+        def wake(_future):
+            try:
+                waker.send(b'\0')
+            except OSError:  # Buffer full, so already woken, or discovery ended
+                pass
+
+        # Descriptions are fetched by a pool of workers, so a slow device does
+        # not stall the socket. <timeout> is still an idle timeout: it restarts
+        # on each reply, and discovery ends only after all fetches are done.
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=util.clamp(workers, 1))
+        pending: t.Dict[concurrent.futures.Future, SSDP] = {}
+        expire = time.monotonic() + search.timeout
+        try:
+            while True:
+                for future in [_ for _ in pending if _.done()]:
+                    ssdp = pending.pop(future)
+                    try:
+                        device = future.result()
+                    except UpnpValueError as e:
+                        log.debug("Error reading device from %s: %s", ssdp, e)
+                        continue
+                    except UpnpError as e:
+                        log.warning("Error reading device from %s: %s", ssdp, e)
+                        continue
+                    stop = search.found(device)
+                    yield device
+                    if stop:
+                        return
+
+                if search.expired():
+                    log.debug("Discovery deadline reached")
+                    return
+                now = time.monotonic()
+                if now >= expire and not pending:
+                    break
+                if now >= expire:
+                    concurrent.futures.wait(
+                        pending, timeout=search.remaining(),
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    continue
+                for key, _ in selector.select(search.remaining(expire - now)):
+                    if key.fileobj is wakeup:
+                        while True:
+                            try:
+                                wakeup.recv(SSDP_BUFFSIZE)
+                            except BlockingIOError:
+                                break
+                        continue
+                    try:
+                        data, (addr, port) = key.fileobj.recvfrom(SSDP_BUFFSIZE)
+                    except BlockingIOError:
+                        continue
+                    expire = time.monotonic() + search.timeout
+
+                    ssdp = search.reply(data, addr, port, key.data)
+                    if ssdp is not None:
+                        future = pool.submit(Device.from_ssdp, ssdp, transport=transport,
+                                             lazy=lazy, keep_xml=keep_xml)
+                        pending[future] = ssdp
+                        future.add_done_callback(wake)
+        finally:
+            # Do not wait for fetches nobody will consume, e.g. on early break
+            pool.shutdown(wait=False, cancel_futures=True)
+            search.finish()
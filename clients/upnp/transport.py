@@ -0,0 +1,189 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""HTTP transport and on-disk cache for description documents"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+import typing as t
+
+import requests
+import requests.adapters
+
+from . import util
+from .common import (
+    HTTP_POOL_HOSTS,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    SSDP_USER_AGENT,
+    UpnpError,
+    UpnpValueError,
+)
+
+log = logging.getLogger(__name__)
+
+
+class Transport:
+    """Pooled keep-alive HTTP transport for descriptions and SOAP calls
+
+    Wraps a requests.Session with per-host connection pools, so repeated
+    requests to the same device reuse their TCP connections. A single instance
+    can be shared by many Devices and threads. Set <pool_block> to never open
+    more than <pool_size> concurrent connections to a host.
+    """
+    _default: t.Optional['Transport'] = None
+
+    @classmethod
+    def default(cls) -> 'Transport':
+        """Shared transport used when none is explicitly given"""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __init__(
+            self, *,
+            timeout:float=HTTP_TIMEOUT,
+            pool_hosts:int=HTTP_POOL_HOSTS,
+            pool_size:int=HTTP_POOL_SIZE,
+            pool_block:bool=False,
+            cache:'DescriptionCache'=None,
+    ):
+        self.timeout = timeout
+        self.cache = cache
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = SSDP_USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_hosts,
+                                                pool_maxsize=pool_size,
+                                                pool_block=pool_block)
+        for prefix in ('http://', 'https://'):
+            self.session.mount(prefix, adapter)
+
+    def request(self, method:str, url:str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            raise UpnpError(e)
+
+    def get(self, url:str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url:str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def stream(self, method:str, url:str, *, max_size:int=0,
+               **kwargs) -> t.Iterator[bytes]:
+        """Yield the response body of a request in chunks, as they arrive
+
+        If <max_size> is set, larger bodies raise UpnpValueError, as soon as
+        their Content-Length header or the bytes read so far exceed it.
+        """
+        r = self.request(method, url, stream=True, **kwargs)
+        try:
+            log.debug("%s %s: %s\n%s", method, url, r.status_code, r.headers)
+            length = r.headers.get('Content-Length', '')
+            if max_size and length.isdigit() and int(length) > max_size:
+                raise UpnpValueError(f"Response from {url} too large: {length} bytes")
+            size = 0
+            for chunk in r.iter_content(chunk_size=None):
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise UpnpValueError(f"Response from {url} too large:"
+                                         f" over {max_size} bytes")
+                yield chunk
+        except requests.RequestException as e:
+            raise UpnpError(e)
+        finally:
+            r.close()  # Returns the connection to the pool if fully read
+
+    def fetch(self, url:str, tag:tuple=None) -> bytes:
+        """Return the content of a description document, using the cache if any
+
+        If the cached entry was stored with the same (non-empty) <tag>, it is
+        trusted as-is and no request is made. Otherwise it is revalidated using
+        its ETag and Last-Modified headers.
+        """
+        if self.cache is None:
+            return self.get(url).content
+
+        entry = self.cache.get(url)
+        if entry is None:
+            headers = {}
+        else:
+            meta, content = entry
+            if tag and tuple(meta.get('tag') or ()) == tuple(tag):
+                log.debug("Using cached %s", url)
+                return content
+            headers = {k: v for k, v in (
+                ('If-None-Match',     meta.get('etag')),
+                ('If-Modified-Since', meta.get('last_modified')),
+            ) if v}
+
+        r = self.get(url, headers=headers)
+        if entry is not None and r.status_code == 304:
+            log.debug("Revalidated cached %s", url)
+            self.cache.put(url, content, tag=tag,
+                           etag=meta.get('etag'), last_modified=meta.get('last_modified'))
+            return content
+        if r.ok:
+            self.cache.put(url, r.content, tag=tag,
+                           etag=r.headers.get('ETag'),
+                           last_modified=r.headers.get('Last-Modified'))
+        return r.content
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DescriptionCache:
+    """Persistent on-disk cache for device and service description documents
+
+    Each entry is keyed by its URL and saved as the raw XML plus a JSON file
+    with its ETag, Last-Modified and a tag made from the device UDN and the
+    SSDP BOOTID.UPNP.ORG and CONFIGID.UPNP.ORG headers. See Transport.fetch().
+    """
+    def __init__(self, path:str=None):
+        self.path = path or util.cache_dir()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _filename(self, url:str) -> str:
+        return os.path.join(self.path, hashlib.sha1(url.encode()).hexdigest())
+
+    def get(self, url:str) -> t.Optional[t.Tuple[dict, bytes]]:
+        filename = self._filename(url)
+        try:
+            with open(filename + '.json') as fd:
+                meta = json.load(fd)
+            with open(filename + '.xml', 'rb') as fd:
+                content = fd.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url:
+            return None
+        return meta, content
+
+    def put(self, url:str, content:bytes, *, tag:tuple=None,
+            etag:str=None, last_modified:str=None) -> None:
+        filename = self._filename(url)
+        meta = dict(url=url, tag=tag, etag=etag, last_modified=last_modified)
+        try:
+            # Content first, so a valid metadata never points to stale content
+            util.write_atomic(filename + '.xml', content)
+            util.write_atomic(filename + '.json', json.dumps(meta).encode())
+        except OSError as e:
+            log.warning("Could not cache %s: %s", url, e)
+
+    def clear(self) -> None:
+        for name in os.listdir(self.path):
+            if name.endswith(('.json', '.xml')):
+                os.remove(os.path.join(self.path, name))
@@ -0,0 +1,142 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""A bunch of utility functions and helpers"""
+
+import collections
+import os
+import os.path
+import re
+import socket
+import struct
+import tempfile
+import typing as t
+import urllib.parse
+
+from . import __title__
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+if t.TYPE_CHECKING:
+    from .xmlelement import XMLElement
+
+_re_snake_case = re.compile(r'((?<=[a-z\d])[A-Z]|(?!^)[A-Z](?=[a-z]))')  # (?!^)([A-Z]+)
+
+
+def snake_case(camelCase: str) -> str:
+    return re.sub(_re_snake_case, r'_\1', camelCase).lower()
+
+
+def attr_tags(obj, node:'XMLElement',
+              tagpath:str="", baseurl:str="", tags:tuple=()) -> None:
+    """Magic method to set attributes from XML tag(name)s
+
+    Tag names must be leafs, not paths, with optional <tagpath> prefix.
+    Automatically convert names from camelCaseURL to camel_case_url.
+    URLs, judged by URL-ending tag name, are joined with <baseurl>
+    """
+    if tagpath: tagpath += '/'
+    for tag in tags:
+        attr = snake_case(tag)
+        value = node.findtext(tagpath+tag) or ""
+        if value and baseurl and attr.endswith('url'):
+            value = urljoin(baseurl, value)
+        setattr(obj, attr, value)
+
+
+def formatdict(d:dict, itemsep=', ', pairsep='=', valuefunc=repr) -> str:
+    return itemsep.join((pairsep.join((k, valuefunc(v))) for k, v in d.items()))
+
+
+def parse_headers(data:str) -> dict:
+    headers = {}
+    for line in data.splitlines():
+        if ':' in line:
+            k, v = line.split(':', 1)
+            headers[k.strip().upper()] = v.strip()
+    return headers
+
+
+def hostname(url:str) -> str:
+    return urllib.parse.urlparse(url).hostname
+
+
+def urljoin(base:str, url:str) -> str:
+    return urllib.parse.urljoin(base, url)
+
+
+def clamp(value:int, lbound:int=None, ubound:int=None) -> int:
+    if lbound is not None: value = max(value, lbound)
+    if ubound is not None: value = min(value, ubound)
+    return value
+
+
+def cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, __title__)
+
+
+def write_atomic(path:str, data:bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def get_network_ip():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        s.connect(('<broadcast>', 0))
+        return s.getsockname()[0]
+
+
+def get_local_ip(remote:str) -> str:
+    """Local IPv4 address of the interface used to reach <remote>"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((remote, 9))  # UDP, so nothing is actually sent
+        return s.getsockname()[0]
+
+
+def get_network_ips() -> t.List[str]:
+    """IPv4 addresses of all network interfaces that are up, except loopback"""
+    ips = []
+    if fcntl is not None and hasattr(socket, 'if_nameindex'):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for _, name in socket.if_nameindex():
+                try:
+                    # SIOCGIFADDR, Linux-only. struct ifreq: char[16] name + sockaddr
+                    ifreq = fcntl.ioctl(s.fileno(), 0x8915,
+                                        struct.pack('256s', name.encode()[:15]))
+                except OSError:  # No IPv4 address, down, or not Linux
+                    continue
+                ips.append(socket.inet_ntoa(ifreq[20:24]))
+    ips = [_ for _ in ips if not _.startswith('127.')]
+    if not ips:
+        try:
+            ips = [_[4][0] for _ in socket.getaddrinfo(socket.gethostname(), None,
+                                                       socket.AF_INET)]
+            ips.append(get_network_ip())
+        except OSError:
+            pass
+    return [_ for _ in dict.fromkeys(ips) if not _.startswith('127.')]
+
+
+# noinspection PyPep8Naming
+def NamedTuple(*a, **kw):
+    """Named Tuple that also allows instance dict-like access foo['bar']
+
+    Creating the class is costly, so callers should build it once and reuse it.
+    """
+    NT = collections.namedtuple(*a, **kw)
+    NT._getindex = NT.__getitem__
+    NT.__getitem__ = lambda self, x: \
+        getattr(self, x) if isinstance(x, str) else self._getindex(x)
+    return NT
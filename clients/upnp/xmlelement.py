@@ -0,0 +1,136 @@
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""XML parsing and querying"""
+
+import concurrent.futures
+import logging
+import threading
+import typing as t
+
+# noinspection PyPep8Naming
+import lxml.etree as ET
+
+from . import metrics
+from .common import FETCH_WORKERS, UpnpValueError
+from .transport import Transport
+
+log = logging.getLogger(__name__)
+
+# Shared by all fromurls() calls, see _fetch_pool()
+_pool: t.Optional[concurrent.futures.ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _fetch_pool() -> concurrent.futures.ThreadPoolExecutor:
+    """Executor of all concurrent description downloads, created on first use
+
+    A single pool, instead of one per Device, so devices loaded concurrently,
+    as in discover(), do not multiply threads and connections to a host.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=FETCH_WORKERS, thread_name_prefix='XMLFetch')
+        return _pool
+
+
+class XMLElement:
+    """Wrapper for a common XML API using either LXML, ET or Minidom"""
+    # Note: XML sucks! It's an incredibly complex format, and lxml is *very* picky
+    # - Serialized XML is always bytes, not str, per the spec
+    # - When converted to str (unicode), there's no <?xml ..?> declaration
+    # - pretty_print=True only works if parsed with remove_blank_text=True
+    # - Dealing with namespaces, many approaches:
+    #     e.find('{fully.qualified.namespace}tag')
+    #     e.find('{*}tag'), using a literal *
+    #     e.find('X:tag', namespaces=e.nsmap), X being (usually) a single lowercase letter
+    @classmethod
+    def fromstring(cls, data:t.Union[str, bytes]):
+        try:
+            return cls(ET.fromstring(data, parser=ET.XMLParser(remove_blank_text=True)))
+        except ET.XMLSyntaxError as e:
+            raise UpnpValueError(e)
+
+    @classmethod
+    def fromurl(cls, url:str, transport:Transport=None, tag:tuple=None):
+        log.debug("Parsing %s", url)
+        # lxml.etree.parse() chokes on URLs if server sets Content-Type header as
+        # 'text/xml; charset="utf-8"', as seen on Ubuntu's MiniDLNA rootDesc.xml
+        # So for now we use requests to download and read bytes content.
+        # Cannot use .text (unicode) content as response contains <?xml ...?>,
+        # which lxml chokes if present on unicode strings
+        # return cls(ET.parse(url))
+        transport = transport or Transport.default()
+        with metrics.timer(metrics.PHASE.DESCRIPTION, url=url):
+            return cls.fromstring(transport.fetch(url, tag))
+
+    @classmethod
+    def fromurls(cls, urls:t.Iterable[str],
+                 transport:Transport=None, tag:tuple=None) -> t.List['XMLElement']:
+        """Concurrently download and parse several URLs, in the given order
+
+        Downloads of all calls share up to FETCH_WORKERS threads.
+        """
+        urls = list(urls)
+        if len(urls) <= 1:
+            return [cls.fromurl(url, transport, tag) for url in urls]
+        return list(_fetch_pool().map(lambda url: cls.fromurl(url, transport, tag), urls))
+
+    @staticmethod
+    def iterparse(chunks:t.Iterable[bytes], events:t.Sequence[str]=('start', 'end'),
+                  ) -> t.Iterator[t.Tuple[str, ET.Element]]:
+        """Parse XML incrementally from <chunks>, yielding (event, element) pairs
+
+        Elements are plain lxml ones, yielded as soon as their event is parsed.
+        """
+        # Size is already bounded by the caller, see SOAP_MAX_SIZE, and large
+        # Browse results have text nodes over the libxml2 default limit of 10MB
+        parser = ET.XMLPullParser(events=events, huge_tree=True)
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                yield from parser.read_events()
+            parser.close()
+        except ET.XMLSyntaxError as e:
+            raise UpnpValueError(e)
+        yield from parser.read_events()
+
+    @classmethod
+    def prettify(cls, s):
+        return cls.fromstring(s).pretty()
+
+    def __init__(self, element):
+        if hasattr(element, 'getroot'):  # ElementTree instead of Element
+            element = element.getroot()
+        self.e: ET.Element = element
+
+    def findtext(self, tagpath:str) -> str:
+        return self.e.findtext(tagpath, namespaces=self.e.nsmap)
+
+    def find(self, tagpath):
+        e = self.e.find(tagpath, namespaces=self.e.nsmap)
+        if e is not None:
+            return self.__class__(e)
+
+    def findall(self, tagpath):
+        for e in self.e.findall(tagpath, namespaces=self.e.nsmap):
+            yield self.__class__(e)
+
+    def pretty(self) -> str:
+        # ET.tostring().decode() is not the same as ET.tostring(..., encoding=str)
+        # The latter errors when using xml_declaration=True
+        return ET.tostring(self.e, pretty_print=True,
+                           xml_declaration=True, encoding='utf-8').decode()
+
+    @property
+    def text(self):
+        return self.e.text
+
+    def __repr__(self):
+        return repr(self.e)
+
+    def __str__(self):
+        return str(self.e)
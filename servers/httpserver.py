@@ -22,6 +22,7 @@ class MyServer(BaseHTTPRequestHandler):
         self.log(post_data.decode())
 
     do_PUT = do_POST
+    do_NOTIFY = do_POST  # UPnP events, see upnp.EventServer
 
     def log(self, data=None):
         for header, value in self.headers.items():
@@ -32,13 +33,18 @@ class MyServer(BaseHTTPRequestHandler):
         print()
 
 
-myServer = HTTPServer((hostName, hostPort), MyServer)
-print(time.asctime(), "Server Starts - %s:%s" % (hostName, hostPort))
+def main():
+    myServer = HTTPServer((hostName, hostPort), MyServer)
+    print(time.asctime(), "Server Starts - %s:%s" % (hostName, hostPort))
 
-try:
-    myServer.serve_forever()
-except KeyboardInterrupt:
-    pass
+    try:
+        myServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
 
-myServer.server_close()
-print(time.asctime(), "Server Stops - %s:%s" % (hostName, hostPort))
+    myServer.server_close()
+    print(time.asctime(), "Server Stops - %s:%s" % (hostName, hostPort))
+
+
+if __name__ == '__main__':
+    main()
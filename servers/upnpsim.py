@@ -0,0 +1,722 @@
+#!/usr/bin/env python3
+#
+# This file is part of upnp-tools, see <https://github.com/MestreLion/upnp>
+# Copyright (C) 2019 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""upnpsim - Simulated UPnP devices on loopback
+
+Each simulated device is the reference ref/rootDesc.xml, a MiniDLNA MediaServer,
+with its own UDN and URLs, and an embedded Internet Gateway Device. Answers
+SSDP M-SEARCH, serves device and service descriptions, and executes the SOAP
+actions of all their services, with in-memory port mappings, for any number of
+virtual devices. Replies can be delayed and SSDP replies dropped, to mimic a
+real, lossy network.
+
+Only needs the standard library. To search it with the client:
+    python3 -m upnp -d 127.0.0.1 --unicast --port 0
+"""
+
+import argparse
+import copy
+import heapq
+import http.server
+import itertools
+import logging
+import pathlib
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import typing as t
+import xml.etree.ElementTree as ET
+import xml.sax.saxutils
+
+import httpserver
+
+log = logging.getLogger(__name__)
+
+SSDP_ADDR = '239.255.255.250'
+SSDP_PORT = 1900
+MAX_AGE = 1800
+
+DEVICE_TYPE = 'urn:schemas-upnp-org:device:{}:1'
+SERVICE_TYPE = 'urn:schemas-upnp-org:service:{}:1'
+DEVICE_NS = 'urn:schemas-upnp-org:device-1-0'
+SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+DIDL_NS = 'urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/'
+
+# Description of all simulated devices. Their UDNs and URLs are set per device
+ROOT_DESC = pathlib.Path(__file__).resolve().parent.parent / 'ref' / 'rootDesc.xml'
+URL_TAGS = ('presentationURL', 'url', 'controlURL', 'eventSubURL', 'SCPDURL')
+
+# Embedded in the root device, as served by MiniUPnPd
+GATEWAY_DESC = (
+    '<deviceList xmlns="urn:schemas-upnp-org:device-1-0"><device><deviceType>{igd}'
+    '</deviceType><friendlyName>Simulated Router</friendlyName><manufacturer>'
+    'upnp-tools</manufacturer><modelName>upnpsim</modelName><UDN>uuid:{uuid}-1'
+    '</UDN><serviceList>{l3f}</serviceList><deviceList><device><deviceType>{wan}'
+    '</deviceType><friendlyName>WANDevice</friendlyName><manufacturer>upnp-tools'
+    '</manufacturer><modelName>upnpsim</modelName><UDN>uuid:{uuid}-2</UDN>'
+    '<serviceList>{wcic}</serviceList><deviceList><device><deviceType>{wcd}'
+    '</deviceType><friendlyName>WANConnectionDevice</friendlyName><manufacturer>'
+    'upnp-tools</manufacturer><modelName>upnpsim</modelName><UDN>uuid:{uuid}-3'
+    '</UDN><serviceList>{wipc}</serviceList></device></deviceList></device>'
+    '</deviceList></device></deviceList>'
+)
+SERVICE_DESC = (
+    '<service><serviceType>{type}</serviceType><serviceId>urn:upnp-org:serviceId:'
+    '{id}</serviceId><controlURL>/ctl/{id}</controlURL><eventSubURL>/evt/{id}'
+    '</eventSubURL><SCPDURL>/{id}.xml</SCPDURL></service>'
+)
+
+# Service name -> actions, as (name, [(argument, direction, variable)])
+# and state variables, as (name, dataType, sendEvents, allowedValues)
+SERVICES: t.Dict[str, t.Tuple[list, list]] = {
+    'ContentDirectory': ([
+        ('GetSearchCapabilities', [('SearchCaps', 'out', 'SearchCapabilities')]),
+        ('GetSortCapabilities', [('SortCaps', 'out', 'SortCapabilities')]),
+        ('GetSystemUpdateID', [('Id', 'out', 'SystemUpdateID')]),
+        ('Browse', [
+            ('ObjectID', 'in', 'A_ARG_TYPE_ObjectID'),
+            ('BrowseFlag', 'in', 'A_ARG_TYPE_BrowseFlag'),
+            ('Filter', 'in', 'A_ARG_TYPE_Filter'),
+            ('StartingIndex', 'in', 'A_ARG_TYPE_Index'),
+            ('RequestedCount', 'in', 'A_ARG_TYPE_Count'),
+            ('SortCriteria', 'in', 'A_ARG_TYPE_SortCriteria'),
+            ('Result', 'out', 'A_ARG_TYPE_Result'),
+            ('NumberReturned', 'out', 'A_ARG_TYPE_Count'),
+            ('TotalMatches', 'out', 'A_ARG_TYPE_Count'),
+            ('UpdateID', 'out', 'A_ARG_TYPE_UpdateID')]),
+    ], [
+        ('SearchCapabilities', 'string', 'no', ()),
+        ('SortCapabilities', 'string', 'no', ()),
+        ('SystemUpdateID', 'ui4', 'yes', ()),
+        ('A_ARG_TYPE_ObjectID', 'string', 'no', ()),
+        ('A_ARG_TYPE_BrowseFlag', 'string', 'no', ('BrowseMetadata', 'BrowseDirectChildren')),
+        ('A_ARG_TYPE_Filter', 'string', 'no', ()),
+        ('A_ARG_TYPE_Index', 'ui4', 'no', ()),
+        ('A_ARG_TYPE_Count', 'ui4', 'no', ()),
+        ('A_ARG_TYPE_SortCriteria', 'string', 'no', ()),
+        ('A_ARG_TYPE_Result', 'string', 'no', ()),
+        ('A_ARG_TYPE_UpdateID', 'ui4', 'no', ()),
+    ]),
+    'ConnectionManager': ([
+        ('GetProtocolInfo', [
+            ('Source', 'out', 'SourceProtocolInfo'),
+            ('Sink', 'out', 'SinkProtocolInfo')]),
+        ('GetCurrentConnectionIDs', [('ConnectionIDs', 'out', 'CurrentConnectionIDs')]),
+    ], [
+        ('SourceProtocolInfo', 'string', 'yes', ()),
+        ('SinkProtocolInfo', 'string', 'yes', ()),
+        ('CurrentConnectionIDs', 'string', 'yes', ()),
+    ]),
+    'X_MS_MediaReceiverRegistrar': ([
+        ('IsAuthorized', [
+            ('DeviceID', 'in', 'A_ARG_TYPE_DeviceID'),
+            ('Result', 'out', 'A_ARG_TYPE_Result')]),
+        ('IsValidated', [
+            ('DeviceID', 'in', 'A_ARG_TYPE_DeviceID'),
+            ('Result', 'out', 'A_ARG_TYPE_Result')]),
+    ], [
+        ('A_ARG_TYPE_DeviceID', 'string', 'no', ()),
+        ('A_ARG_TYPE_Result', 'int', 'no', ()),
+    ]),
+    'Layer3Forwarding': ([
+        ('GetDefaultConnectionService', [
+            ('NewDefaultConnectionService', 'out', 'DefaultConnectionService')]),
+    ], [
+        ('DefaultConnectionService', 'string', 'yes', ()),
+    ]),
+    'WANCommonInterfaceConfig': ([
+        ('GetCommonLinkProperties', [
+            ('NewWANAccessType', 'out', 'WANAccessType'),
+            ('NewLayer1UpstreamMaxBitRate', 'out', 'Layer1UpstreamMaxBitRate'),
+            ('NewLayer1DownstreamMaxBitRate', 'out', 'Layer1DownstreamMaxBitRate'),
+            ('NewPhysicalLinkStatus', 'out', 'PhysicalLinkStatus')]),
+        ('GetTotalBytesSent', [('NewTotalBytesSent', 'out', 'TotalBytesSent')]),
+        ('GetTotalBytesReceived', [('NewTotalBytesReceived', 'out', 'TotalBytesReceived')]),
+        ('GetTotalPacketsSent', [('NewTotalPacketsSent', 'out', 'TotalPacketsSent')]),
+        ('GetTotalPacketsReceived', [
+            ('NewTotalPacketsReceived', 'out', 'TotalPacketsReceived')]),
+    ], [
+        ('WANAccessType', 'string', 'no', ('DSL', 'POTS', 'Cable', 'Ethernet')),
+        ('Layer1UpstreamMaxBitRate', 'ui4', 'no', ()),
+        ('Layer1DownstreamMaxBitRate', 'ui4', 'no', ()),
+        ('PhysicalLinkStatus', 'string', 'yes', ('Up', 'Down')),
+        ('TotalBytesSent', 'ui4', 'no', ()),
+        ('TotalBytesReceived', 'ui4', 'no', ()),
+        ('TotalPacketsSent', 'ui4', 'no', ()),
+        ('TotalPacketsReceived', 'ui4', 'no', ()),
+    ]),
+    'WANIPConnection': ([
+        ('GetStatusInfo', [
+            ('NewConnectionStatus', 'out', 'ConnectionStatus'),
+            ('NewLastConnectionError', 'out', 'LastConnectionError'),
+            ('NewUptime', 'out', 'Uptime')]),
+        ('GetNATRSIPStatus', [
+            ('NewRSIPAvailable', 'out', 'RSIPAvailable'),
+            ('NewNATEnabled', 'out', 'NATEnabled')]),
+        ('GetExternalIPAddress', [
+            ('NewExternalIPAddress', 'out', 'ExternalIPAddress')]),
+        ('GetGenericPortMappingEntry', [
+            ('NewPortMappingIndex', 'in', 'PortMappingNumberOfEntries'),
+            ('NewRemoteHost', 'out', 'RemoteHost'),
+            ('NewExternalPort', 'out', 'ExternalPort'),
+            ('NewProtocol', 'out', 'PortMappingProtocol'),
+            ('NewInternalPort', 'out', 'InternalPort'),
+            ('NewInternalClient', 'out', 'InternalClient'),
+            ('NewEnabled', 'out', 'PortMappingEnabled'),
+            ('NewPortMappingDescription', 'out', 'PortMappingDescription'),
+            ('NewLeaseDuration', 'out', 'PortMappingLeaseDuration')]),
+        ('GetSpecificPortMappingEntry', [
+            ('NewRemoteHost', 'in', 'RemoteHost'),
+            ('NewExternalPort', 'in', 'ExternalPort'),
+            ('NewProtocol', 'in', 'PortMappingProtocol'),
+            ('NewInternalPort', 'out', 'InternalPort'),
+            ('NewInternalClient', 'out', 'InternalClient'),
+            ('NewEnabled', 'out', 'PortMappingEnabled'),
+            ('NewPortMappingDescription', 'out', 'PortMappingDescription'),
+            ('NewLeaseDuration', 'out', 'PortMappingLeaseDuration')]),
+        ('AddPortMapping', [
+            ('NewRemoteHost', 'in', 'RemoteHost'),
+            ('NewExternalPort', 'in', 'ExternalPort'),
+            ('NewProtocol', 'in', 'PortMappingProtocol'),
+            ('NewInternalPort', 'in', 'InternalPort'),
+            ('NewInternalClient', 'in', 'InternalClient'),
+            ('NewEnabled', 'in', 'PortMappingEnabled'),
+            ('NewPortMappingDescription', 'in', 'PortMappingDescription'),
+            ('NewLeaseDuration', 'in', 'PortMappingLeaseDuration')]),
+        ('DeletePortMapping', [
+            ('NewRemoteHost', 'in', 'RemoteHost'),
+            ('NewExternalPort', 'in', 'ExternalPort'),
+            ('NewProtocol', 'in', 'PortMappingProtocol')]),
+    ], [
+        ('ConnectionStatus', 'string', 'yes', ('Unconfigured', 'Connected', 'Disconnected')),
+        ('LastConnectionError', 'string', 'no', ('ERROR_NONE',)),
+        ('Uptime', 'ui4', 'no', ()),
+        ('RSIPAvailable', 'boolean', 'no', ()),
+        ('NATEnabled', 'boolean', 'no', ()),
+        ('ExternalIPAddress', 'string', 'yes', ()),
+        ('PortMappingNumberOfEntries', 'ui2', 'yes', ()),
+        ('PortMappingEnabled', 'boolean', 'no', ()),
+        ('PortMappingLeaseDuration', 'ui4', 'no', ()),
+        ('RemoteHost', 'string', 'no', ()),
+        ('ExternalPort', 'ui2', 'no', ()),
+        ('InternalPort', 'ui2', 'no', ()),
+        ('PortMappingProtocol', 'string', 'no', ('TCP', 'UDP')),
+        ('InternalClient', 'string', 'no', ()),
+        ('PortMappingDescription', 'string', 'no', ()),
+    ]),
+}
+
+
+def scpd(service:str) -> str:
+    actions, variables = SERVICES[service]
+    return ''.join((
+        '<?xml version="1.0"?>\n<scpd xmlns="urn:schemas-upnp-org:service-1-0">'
+        '<specVersion><major>1</major><minor>0</minor></specVersion><actionList>',
+        *(f'<action><name>{name}</name><argumentList>' + ''.join(
+            f'<argument><name>{arg}</name><direction>{direction}</direction>'
+            f'<relatedStateVariable>{var}</relatedStateVariable></argument>'
+            for arg, direction, var in args) + '</argumentList></action>'
+          for name, args in actions),
+        '</actionList><serviceStateTable>',
+        *(f'<stateVariable sendEvents="{events}"><name>{name}</name><dataType>'
+          f'{datatype}</dataType>' + (('<allowedValueList>' + ''.join(
+              f'<allowedValue>{_}</allowedValue>' for _ in allowed) +
+              '</allowedValueList>') if allowed else '') + '</stateVariable>'
+          for name, datatype, events, allowed in variables),
+        '</serviceStateTable></scpd>',
+    ))
+
+
+def template(path:t.Union[str, pathlib.Path]=ROOT_DESC) -> ET.Element:
+    """Root description in <path>, with the gateway devices embedded"""
+    ET.register_namespace('', DEVICE_NS)
+    ET.register_namespace('dlna', 'urn:schemas-dlna-org:device-1-0')
+    root = ET.parse(path).getroot()
+    device = root.find(f'{{{DEVICE_NS}}}device')
+    device.append(ET.fromstring(GATEWAY_DESC.format(
+        uuid='{uuid}',
+        igd=DEVICE_TYPE.format('InternetGatewayDevice'),
+        wan=DEVICE_TYPE.format('WANDevice'),
+        wcd=DEVICE_TYPE.format('WANConnectionDevice'),
+        **{key: SERVICE_DESC.format(type=SERVICE_TYPE.format(name), id=name)
+           for key, name in (('l3f',  'Layer3Forwarding'),
+                             ('wcic', 'WANCommonInterfaceConfig'),
+                             ('wipc', 'WANIPConnection'))},
+    )))
+    return root
+
+
+class SOAPFault(Exception):
+    def __init__(self, code:int, description:str):
+        super().__init__(code, description)
+        self.code = code
+        self.description = description
+
+
+class Device:
+    """A simulated Internet Gateway Device and its state"""
+    def __init__(self, index:int, root:ET.Element):
+        self.index = index
+        self.uuid = f'5a1e5a1e-0000-4000-8000-{index:012x}'
+        self.external_ip = f'203.0.113.{index % 254 + 1}'
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        # (remote host, external port, protocol) -> other arguments, in insertion order
+        self.mappings: t.Dict[t.Tuple[str, int, str], t.Dict[str, str]] = {}
+        # SCPD and control paths, relative to /<index>, -> service name and type
+        self.scpds: t.Dict[str, t.Tuple[str, str]] = {}
+        self.controls: t.Dict[str, t.Tuple[str, str]] = {}
+        # (ST, USN) pairs this device advertises, REF: UDA2/1.3.2
+        self.targets: t.List[t.Tuple[str, str]] = []
+
+        ns = f'{{{DEVICE_NS}}}'
+        root = copy.deepcopy(root)
+        devices = list(root.iter(f'{ns}device'))
+        name = devices[0].find(f'{ns}friendlyName')
+        name.text = f'{name.text} {index}'
+        devices[0].find(f'{ns}serialNumber').text = f'{index:08d}'
+        for i, device in enumerate(devices):
+            udn = device.find(f'{ns}UDN')
+            udn.text = f'uuid:{self.uuid}-{i}' if i == 0 else udn.text.format(uuid=self.uuid)
+            if i == 0:
+                self.targets.append(('upnp:rootdevice', f'{udn.text}::upnp:rootdevice'))
+            device_type = device.findtext(f'{ns}deviceType')
+            self.targets += [(udn.text, udn.text),
+                             (device_type, f'{udn.text}::{device_type}')]
+            for service in device.findall(f'{ns}serviceList/{ns}service'):
+                service_type = service.findtext(f'{ns}serviceType')
+                entry = (service_type.split(':')[-2], service_type)
+                self.scpds[service.findtext(f'{ns}SCPDURL')] = entry
+                self.controls[service.findtext(f'{ns}controlURL')] = entry
+                self.targets.append((service_type, f'{udn.text}::{service_type}'))
+        # All devices share a single HTTP server, each under its own path
+        for tag in URL_TAGS:
+            for e in root.iter(f'{ns}{tag}'):
+                if e.text and e.text.startswith('/'):
+                    e.text = f'/{index}{e.text}'
+        self.description = ('<?xml version="1.0"?>\n' +
+                            ET.tostring(root, encoding='unicode'))
+
+    def action(self, name:str, args:t.Dict[str, str]) -> t.Dict[str, t.Any]:
+        """Execute SOAP action <name>, returning its output arguments"""
+        method = getattr(self, f'do_{name}', None)
+        if method is None:
+            raise SOAPFault(401, "Invalid Action")
+        with self.lock:
+            return method(args)
+
+    # noinspection PyUnusedLocal
+    def do_GetDefaultConnectionService(self, args):
+        return {'NewDefaultConnectionService':
+                f'uuid:{self.uuid}-3:WANConnectionDevice:1,'
+                f'urn:upnp-org:serviceId:WANIPConnection'}
+
+    # noinspection PyUnusedLocal
+    def do_GetSearchCapabilities(self, args):
+        return {'SearchCaps': ''}
+
+    # noinspection PyUnusedLocal
+    def do_GetSortCapabilities(self, args):
+        return {'SortCaps': ''}
+
+    # noinspection PyUnusedLocal
+    def do_GetSystemUpdateID(self, args):
+        return {'Id': 1}
+
+    def do_Browse(self, args):
+        # An empty library
+        if args.get('ObjectID') != '0':
+            raise SOAPFault(701, "No such object")
+        if args.get('BrowseFlag') == 'BrowseMetadata':
+            result = (f'<container id="0" parentID="-1" restricted="1" childCount="0">'
+                      f'<dc:title>root</dc:title><upnp:class>object.container'
+                      f'.storageFolder</upnp:class></container>')
+            count = 1
+        else:
+            result, count = '', 0
+        return {'Result': f'<DIDL-Lite xmlns="{DIDL_NS}" xmlns:dc="http://purl.org/dc'
+                          f'/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0'
+                          f'/upnp/">{result}</DIDL-Lite>',
+                'NumberReturned': count, 'TotalMatches': count, 'UpdateID': 1}
+
+    # noinspection PyUnusedLocal
+    def do_GetProtocolInfo(self, args):
+        return {'Source': 'http-get:*:audio/mpeg:*,http-get:*:video/mp4:*', 'Sink': ''}
+
+    # noinspection PyUnusedLocal
+    def do_GetCurrentConnectionIDs(self, args):
+        return {'ConnectionIDs': '0'}
+
+    # noinspection PyUnusedLocal
+    def do_IsAuthorized(self, args):
+        return {'Result': 1}
+
+    # noinspection PyUnusedLocal
+    def do_IsValidated(self, args):
+        return {'Result': 1}
+
+    # noinspection PyUnusedLocal
+    def do_GetCommonLinkProperties(self, args):
+        return {'NewWANAccessType': 'Ethernet',
+                'NewLayer1UpstreamMaxBitRate': 100_000_000,
+                'NewLayer1DownstreamMaxBitRate': 100_000_000,
+                'NewPhysicalLinkStatus': 'Up'}
+
+    def _traffic(self, scale:int) -> int:
+        # Steadily increasing, wrapping as real ui4 counters do
+        return int((time.monotonic() - self.started) * scale) % 2**32
+
+    def do_GetTotalBytesSent(self, args):
+        return {'NewTotalBytesSent': self._traffic(125_000)}
+
+    def do_GetTotalBytesReceived(self, args):
+        return {'NewTotalBytesReceived': self._traffic(1_250_000)}
+
+    def do_GetTotalPacketsSent(self, args):
+        return {'NewTotalPacketsSent': self._traffic(100)}
+
+    def do_GetTotalPacketsReceived(self, args):
+        return {'NewTotalPacketsReceived': self._traffic(1000)}
+
+    # noinspection PyUnusedLocal
+    def do_GetStatusInfo(self, args):
+        return {'NewConnectionStatus': 'Connected',
+                'NewLastConnectionError': 'ERROR_NONE',
+                'NewUptime': int(time.monotonic() - self.started)}
+
+    # noinspection PyUnusedLocal
+    def do_GetNATRSIPStatus(self, args):
+        return {'NewRSIPAvailable': 0, 'NewNATEnabled': 1}
+
+    # noinspection PyUnusedLocal
+    def do_GetExternalIPAddress(self, args):
+        return {'NewExternalIPAddress': self.external_ip}
+
+    @staticmethod
+    def _key(args) -> t.Tuple[str, int, str]:
+        try:
+            port = int(args.get('NewExternalPort', ''))
+        except ValueError:
+            raise SOAPFault(402, "Invalid Args")
+        protocol = args.get('NewProtocol', '')
+        if protocol not in ('TCP', 'UDP') or not 0 < port < 65536:
+            raise SOAPFault(402, "Invalid Args")
+        return args.get('NewRemoteHost', ''), port, protocol
+
+    def do_GetGenericPortMappingEntry(self, args):
+        try:
+            index = int(args.get('NewPortMappingIndex', ''))
+        except ValueError:
+            raise SOAPFault(402, "Invalid Args")
+        if not 0 <= index < len(self.mappings):
+            raise SOAPFault(713, "SpecifiedArrayIndexInvalid")
+        (host, port, protocol), entry = next(itertools.islice(
+            self.mappings.items(), index, None))
+        return {'NewRemoteHost': host, 'NewExternalPort': port,
+                'NewProtocol': protocol, **entry}
+
+    def do_GetSpecificPortMappingEntry(self, args):
+        entry = self.mappings.get(self._key(args))
+        if entry is None:
+            raise SOAPFault(714, "NoSuchEntryInArray")
+        return dict(entry)
+
+    def do_AddPortMapping(self, args):
+        key = self._key(args)
+        entry = {_: args.get(_, '') for _ in (
+            'NewInternalPort', 'NewInternalClient', 'NewEnabled',
+            'NewPortMappingDescription', 'NewLeaseDuration')}
+        if not (entry['NewInternalPort'].isdigit() and entry['NewInternalClient']):
+            raise SOAPFault(402, "Invalid Args")
+        old = self.mappings.get(key)
+        if old is not None and old['NewInternalClient'] != entry['NewInternalClient']:
+            raise SOAPFault(718, "ConflictInMappingEntry")
+        self.mappings[key] = entry
+        return {}
+
+    def do_DeletePortMapping(self, args):
+        if self.mappings.pop(self._key(args), None) is None:
+            raise SOAPFault(714, "NoSuchEntryInArray")
+        return {}
+
+
+class Handler(httpserver.MyServer):
+    """Descriptions and SOAP control of all devices, under /<index>/
+
+    In verbose mode, the headers and body of SOAP requests are printed by
+    the base httpserver handler.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Headers and body are written separately
+    server: 'HTTPServer'
+
+    def route(self) -> t.Tuple[t.Optional[Device], str]:
+        match = re.fullmatch(r'/(\d+)(/.*)', self.path)
+        if not match or int(match.group(1)) >= len(self.server.simulator.devices):
+            return None, ""
+        return self.server.simulator.devices[int(match.group(1))], match.group(2)
+
+    def do_GET(self):
+        self.server.simulator.delay()
+        device, path = self.route()
+        if device is not None and path == '/rootDesc.xml':
+            return self.reply(200, device.description)
+        if device is not None and path in device.scpds:
+            return self.reply(200, scpd(device.scpds[path][0]))
+        self.reply(404, "")
+
+    def do_POST(self):
+        simulator = self.server.simulator
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if log.isEnabledFor(logging.DEBUG):
+            self.log(data.decode(errors='replace'))
+        simulator.delay()
+        device, path = self.route()
+        if device is None or path not in device.controls:
+            return self.reply(404, "")
+        name, service = device.controls[path]
+        try:
+            action = ET.fromstring(data).find(f'{{{SOAP_ENV}}}Body/*')
+            if action is None:
+                raise ET.ParseError("no action")
+        except ET.ParseError:
+            return self.fault(SOAPFault(402, "Invalid Args"))
+        action_name = action.tag.rpartition('}')[2]
+        if action_name not in (_[0] for _ in SERVICES[name][0]):
+            return self.fault(SOAPFault(401, "Invalid Action"))
+        args = {_.tag.rpartition('}')[2]: _.text or '' for _ in action}
+        try:
+            out = device.action(action_name, args)
+        except SOAPFault as e:
+            return self.fault(e)
+        simulator.calls += 1
+        self.reply(200, self.envelope(
+            f'<u:{action_name}Response xmlns:u="{service}">' +
+            ''.join(f'<{k}>{xml.sax.saxutils.escape(str(v))}</{k}>' for k, v in out.items()) +
+            f'</u:{action_name}Response>'))
+
+    @staticmethod
+    def envelope(body:str) -> str:
+        return (f'<?xml version="1.0"?>\n<s:Envelope xmlns:s="{SOAP_ENV}"'
+                f' s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+                f'<s:Body>{body}</s:Body></s:Envelope>')
+
+    def fault(self, e:SOAPFault) -> None:
+        self.reply(500, self.envelope(
+            '<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError'
+            '</faultstring><detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0">'
+            f'<errorCode>{e.code}</errorCode><errorDescription>{e.description}'
+            '</errorDescription></UPnPError></detail></s:Fault>'))
+
+    def reply(self, status:int, body:str) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset="utf-8"')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        log.debug("%s - %s", self.address_string(), fmt % args)
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+    simulator: 'Simulator'
+
+
+class Simulator:
+    """Simulated devices, answering SSDP searches and HTTP requests
+
+    All devices are described by the root description file <description>,
+    each with its own UDN and URLs. Searches are answered on <host>:<ssdp_port>,
+    also on the SSDP multicast group if <multicast>, and HTTP requests on
+    <host>:<http_port>. Replies are delayed by <latency> seconds plus a random
+    <jitter>, and a <loss> fraction of the SSDP replies is dropped. Ports 0
+    pick random ones, see ports.
+    Can also be used as a context manager, running in background threads.
+    """
+    def __init__(self, devices:int=1, *, host:str='127.0.0.1', http_port:int=0,
+                 ssdp_port:int=SSDP_PORT, multicast:bool=False,
+                 latency:float=0, jitter:float=0, loss:float=0,
+                 description:t.Union[str, pathlib.Path]=ROOT_DESC):
+        root = template(description)
+        self.devices = [Device(_, root) for _ in range(devices)]
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.calls = 0  # SOAP actions executed
+        self._stop = threading.Event()
+        self._threads: t.List[threading.Thread] = []
+        self._queue: t.List[t.Tuple[float, int, bytes, tuple]] = []  # SSDP replies
+        self._counter = itertools.count()
+        self._wakeup = threading.Condition()
+
+        self.http = HTTPServer((host, http_port), Handler)
+        self.http.simulator = self
+        self.ssdp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.ssdp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if multicast:
+            self.ssdp.bind(('', ssdp_port))
+            self.ssdp.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                 socket.inet_aton(SSDP_ADDR) + socket.inet_aton(host))
+        else:
+            self.ssdp.bind((host, ssdp_port))
+        self.ssdp.settimeout(0.5)  # To check for stop()
+
+    @property
+    def ports(self) -> t.Tuple[int, int]:
+        """Actual (HTTP, SSDP) ports"""
+        return self.http.server_address[1], self.ssdp.getsockname()[1]
+
+    def delay(self) -> None:
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def location(self, device:Device) -> str:
+        return f'http://{self.host}:{self.ports[0]}/{device.index}/rootDesc.xml'
+
+    def search(self, data:bytes, addr:tuple) -> None:
+        """Queue the replies to an M-SEARCH request"""
+        if not data.startswith(b'M-SEARCH'):
+            return
+        headers = {k.strip().upper(): v.strip() for k, _, v in (
+            _.partition(':') for _ in data.decode(errors='replace').splitlines()[1:])}
+        st = headers.get('ST', '')
+        now = time.monotonic()
+        for device in self.devices:
+            for target, usn in device.targets:
+                if st not in ('ssdp:all', target):
+                    continue
+                if random.random() < self.loss:
+                    continue
+                reply = '\r\n'.join((
+                    'HTTP/1.1 200 OK',
+                    f'CACHE-CONTROL: max-age={MAX_AGE}',
+                    'EXT:',
+                    f'LOCATION: {self.location(device)}',
+                    'SERVER: Linux/5.4 UPnP/1.1 upnpsim/1',
+                    f'ST: {target}',
+                    f'USN: {usn}',
+                    'BOOTID.UPNP.ORG: 1',
+                    'CONFIGID.UPNP.ORG: 1',
+                    '', '',
+                )).encode()
+                due = now + self.latency + random.uniform(0, self.jitter)
+                with self._wakeup:
+                    heapq.heappush(self._queue, (due, next(self._counter), reply, addr))
+                    self._wakeup.notify()
+
+    def _receive(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data, addr = self.ssdp.recvfrom(8192)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self.search(data, addr)
+
+    def _send(self) -> None:
+        while True:
+            with self._wakeup:
+                while not self._stop.is_set() and (
+                    not self._queue or self._queue[0][0] > time.monotonic()
+                ):
+                    self._wakeup.wait(self._queue[0][0] - time.monotonic()
+                                      if self._queue else None)
+                if self._stop.is_set():
+                    return
+                _, _, reply, addr = heapq.heappop(self._queue)
+            try:
+                self.ssdp.sendto(reply, addr)
+            except OSError as e:
+                log.warning("Error replying to %s: %s", addr, e)
+
+    def start(self) -> 'Simulator':
+        self._stop.clear()
+        self._threads = [threading.Thread(target=_, daemon=True) for _ in (
+            self.http.serve_forever, self._receive, self._send)]
+        for thread in self._threads:
+            thread.start()
+        log.info("Simulating %d devices: HTTP on %s:%d, SSDP on %s:%d",
+                 len(self.devices), self.host, self.ports[0], self.host, self.ports[1])
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        self.http.shutdown()
+        for thread in self._threads:
+            thread.join()
+        self.http.server_close()
+        self.ssdp.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-q', '--quiet', dest='loglevel', default=logging.INFO,
+                        const=logging.WARNING, action='store_const',
+                        help="Suppress informative messages.")
+    parser.add_argument('-v', '--verbose', dest='loglevel',
+                        const=logging.DEBUG, action='store_const',
+                        help="Verbose mode, log every request.")
+    parser.add_argument('-n', '--devices', default=1, type=int,
+                        help="Number of simulated devices. [Default: %(default)s]")
+    parser.add_argument('-H', '--host', default='127.0.0.1',
+                        help="Address to listen on. [Default: %(default)r]")
+    parser.add_argument('-p', '--http-port', default=0, type=int,
+                        help="HTTP port. [Default: random]")
+    parser.add_argument('-s', '--ssdp-port', default=SSDP_PORT, type=int,
+                        help="SSDP port. [Default: %(default)s]")
+    parser.add_argument('-m', '--multicast', default=False, action='store_true',
+                        help=f"Also answer searches sent to {SSDP_ADDR}.")
+    parser.add_argument('-d', '--description', default=ROOT_DESC, metavar='FILE',
+                        help="Root description of the simulated devices."
+                             " [Default: %(default)s]")
+    parser.add_argument('-l', '--latency', default=0, type=float,
+                        help="Delay of every reply, in seconds. [Default: none]")
+    parser.add_argument('-j', '--jitter', default=0, type=float,
+                        help="Max random extra delay, in seconds. [Default: none]")
+    parser.add_argument('-L', '--loss', default=0, type=float,
+                        help="Fraction of SSDP replies to drop, from 0 to 1."
+                             " [Default: none]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.loglevel, format='%(levelname)-5.5s: %(message)s')
+    simulator = Simulator(args.devices, host=args.host, http_port=args.http_port,
+                          ssdp_port=args.ssdp_port, multicast=args.multicast,
+                          latency=args.latency, jitter=args.jitter, loss=args.loss,
+                          description=args.description)
+    with simulator:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except OSError as err:
+        log.error(err)
+        sys.exit(1)